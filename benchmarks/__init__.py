@@ -0,0 +1,20 @@
+"""Offline benchmarks of the bot
+
+The bot reads its config on import. Unless `CONFIG_FILE_PATH` is set, a minimal
+config pointing to a fake api is written to a temporary file before any of the
+benchmarks import the bot's modules.
+"""
+
+import os
+import tempfile
+
+if "CONFIG_FILE_PATH" not in os.environ:
+    _config_file = tempfile.NamedTemporaryFile("w", suffix=".ini", delete=False)
+    _config_file.write(
+        "[Main]\ncreator_id = 1\nbot_token = 1:benchmark\n"
+        "[Api]\nbase_url = http://birthday-api\n"
+        f"[Storage]\ndatabase = {_config_file.name}.sqlite3\n"
+        f"[Logs]\nlog_to = {tempfile.gettempdir()}\nlevel = WARNING\n"
+    )
+    _config_file.close()
+    os.environ["CONFIG_FILE_PATH"] = _config_file.name
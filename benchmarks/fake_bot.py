@@ -0,0 +1,98 @@
+"""Bot which answers Bot API calls locally
+
+`FakeBot` replaces the HTTP call at the bottom of `telegram.Bot`, so handlers,
+`MessageDispatcher` and the `Application` run their real code without Telegram.
+"""
+
+import asyncio
+import itertools
+import random
+import time
+from collections import defaultdict, deque
+
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "BirthdayBot",
+    "username": "BirthdayBot",
+}
+
+# endpoints answered with the sent message instead of True
+MESSAGE_ENDPOINTS = {"sendMessage", "editMessageText"}
+
+
+class FakeBot(ExtBot):
+    """Bot which records its calls instead of sending them to Telegram
+
+    Every call takes about `latency` seconds. When `rate` or `chat_rate` is set,
+    more messages per second than that, in total or to a single chat, are answered
+    with `RetryAfter` like the Bot API does.
+
+    Args:
+        latency (float): Seconds every call takes on average
+        rate (int): Messages per second allowed in total, `None` for no limit
+        chat_rate (int): Messages per second allowed to a chat, `None` for no limit
+
+    Attributes:
+        calls (dict): Number of calls by endpoint
+        sent (list): (chat_id, text) of the sent messages
+        flood_errors (int): Number of calls answered with `RetryAfter`
+    """
+
+    def __init__(self, latency=0.0, rate=None, chat_rate=None):
+        super().__init__("1:fake")
+        with self._unfrozen():
+            self.latency = latency
+            self.rate = rate
+            self.chat_rate = chat_rate
+            self.calls = defaultdict(int)
+            self.sent = []
+            self.flood_errors = 0
+            self._message_ids = itertools.count(1)
+            self._sent_at = deque()
+            self._chat_sent_at = defaultdict(deque)
+
+    async def _do_post(self, endpoint, data, **timeouts):
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+        if endpoint == "getMe":
+            return BOT_USER
+        if endpoint not in MESSAGE_ENDPOINTS:
+            return True
+
+        chat_id = int(data.get("chat_id", 0))
+        if endpoint == "sendMessage":
+            self._check_limits(chat_id)
+            self.sent.append((chat_id, data["text"]))
+
+        return {
+            "message_id": int(data.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": data["text"],
+        }
+
+    def _check_limits(self, chat_id) -> None:
+        """Raise `RetryAfter` if sending to the chat exceeds the limits"""
+        now = time.monotonic()
+        for sent_at, limit in (
+            (self._sent_at, self.rate),
+            (self._chat_sent_at[chat_id], self.chat_rate),
+        ):
+            if limit is None:
+                continue
+            while sent_at and now - sent_at[0] > 1:
+                sent_at.popleft()
+            if len(sent_at) >= limit:
+                # the bot is frozen after __init__, like all telegram objects
+                with self._unfrozen():
+                    self.flood_errors += 1
+                raise RetryAfter(1)
+
+        self._sent_at.append(now)
+        self._chat_sent_at[chat_id].append(now)
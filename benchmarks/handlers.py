@@ -0,0 +1,174 @@
+"""Benchmark the handlers and reminders at different numbers of birthdays.
+
+The updates of each conversation are processed by the application built in
+`birthday_bot`, its bot is a `FakeBot` and the api is the in-process `StubApi`,
+so the numbers show the bot's own cost plus the simulated latencies.
+
+Each scenario runs `--repeat` times, for a different user every time while there
+are enough users. The time of a whole conversation is measured, e.g. all four
+updates of /add.
+
+Usage:
+    python -m benchmarks.handlers [--sizes N ...] [--users N] [--repeat N]
+        [--api-latency S] [--bot-latency S] [--rate N]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timezone
+
+from telegram.ext import CallbackContext
+
+from benchmarks import updates
+from benchmarks.fake_bot import FakeBot
+from benchmarks.stub_api import BirthdayDataset, StubApi
+from src.birthday_bot import build_application
+from src.core import api_requests
+from src.core.job_runs import JobRun
+from src.core.outbox import OutboxEntry
+from src.core.preferences import ReminderSchedule, ReminderShard
+from src.handlers.reminder import prefetch_reminders, send_reminders
+
+
+class Scenario:
+    """Timings of one scenario and the calls it made
+
+    Args:
+        name (str): Name of the scenario
+        stub (StubApi): Stub whose requests are counted
+        bot (FakeBot): Bot whose calls are counted
+    """
+
+    def __init__(self, name, stub, bot):
+        self.name = name
+        self.stub = stub
+        self.bot = bot
+        self.durations = []
+        self._requests = sum(stub.requests.values())
+        self._calls = sum(bot.calls.values())
+
+    async def measure(self, coroutine) -> None:
+        start = time.perf_counter()
+        await coroutine
+        self.durations.append(time.perf_counter() - start)
+
+    def report(self) -> str:
+        runs = len(self.durations)
+        requests = (sum(self.stub.requests.values()) - self._requests) / runs
+        calls = (sum(self.bot.calls.values()) - self._calls) / runs
+        median = statistics.median(self.durations)
+        p95 = (
+            statistics.quantiles(self.durations, n=20)[18]
+            if runs > 1
+            else self.durations[0]
+        )
+        return (
+            f"  {self.name:<20} median {median * 1000:9.2f} ms, "
+            f"p95 {p95 * 1000:9.2f} ms, "
+            f"{requests:5.1f} api requests, {calls:5.1f} bot calls per run"
+        )
+
+
+async def process(application, conversation) -> None:
+    for update in conversation:
+        await application.process_update(update)
+
+
+async def benchmark_size(application, bot, size, users, repeat, api_latency, rate):
+    """Run all scenarios against a dataset of `size` birthdays"""
+    users = max(1, min(users, size))
+    dataset = BirthdayDataset(size, users)
+    stub = StubApi(dataset, latency=api_latency)
+    api_requests.api_client = api_requests.create_api_client(transport=stub)
+    api_requests.session_manager.clear()
+    for user_id in range(1, users + 1):
+        api_requests.response_cache.invalidate(user_id)
+    OutboxEntry.delete().execute()
+    JobRun.delete().execute()
+
+    print(f"{size} birthdays of {users} users")
+    run_users = [number % users + 1 for number in range(repeat)]
+
+    scenario = Scenario("list", stub, bot)
+    for user_id in run_users:
+        await scenario.measure(
+            application.process_update(updates.message(bot, user_id, "/list"))
+        )
+    print(scenario.report())
+
+    scenario = Scenario("add conversation", stub, bot)
+    added = []
+    for user_id in run_users:
+        added.append((user_id, dataset.next_id))
+        conversation = updates.add_conversation(
+            bot, user_id, f"Added {dataset.next_id}", note="Added by the benchmark"
+        )
+        await scenario.measure(process(application, conversation))
+    print(scenario.report())
+
+    scenario = Scenario("change conversation", stub, bot)
+    for user_id, birthday_id in added:
+        conversation = updates.change_conversation(
+            bot, user_id, birthday_id, f"Changed {birthday_id}"
+        )
+        await scenario.measure(process(application, conversation))
+    print(scenario.report())
+
+    scenario = Scenario("delete conversation", stub, bot)
+    for user_id, birthday_id in added:
+        conversation = updates.delete_conversation(bot, user_id, birthday_id)
+        await scenario.measure(process(application, conversation))
+    print(scenario.report())
+
+    # every user of the dataset is due at the default reminder time
+    run_time = ReminderSchedule(datetime.now(timezone.utc).date()).default_time
+    scenario = Scenario("reminder", stub, bot)
+    await scenario.measure(
+        send_reminders(bot, run_time, [ReminderShard(run_time)], rate=rate)
+    )
+    print(scenario.report())
+
+    OutboxEntry.delete().execute()
+    scenario = Scenario("prefetched reminder", stub, bot)
+    context = CallbackContext(application)
+    await scenario.measure(prefetch_reminders(context))
+    await scenario.measure(send_reminders(bot, run_time, [], rate=rate))
+    scenario.durations = [sum(scenario.durations)]
+    print(scenario.report())
+
+    await api_requests.api_client.aclose()
+
+
+async def main(sizes, users, repeat, api_latency, bot_latency, rate) -> None:
+    bot = FakeBot(latency=bot_latency)
+    application = build_application(bot)
+    await application.initialize()
+
+    for size in sizes:
+        await benchmark_size(application, bot, size, users, repeat, api_latency, rate)
+
+    await application.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 10_000, 1_000_000])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    parser.add_argument("--bot-latency", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=1000, help="messages per second")
+    args = parser.parse_args()
+
+    asyncio.run(
+        main(
+            args.sizes,
+            args.users,
+            args.repeat,
+            args.api_latency,
+            args.bot_latency,
+            args.rate,
+        )
+    )
@@ -0,0 +1,262 @@
+"""Replay a synthetic mix of user conversations at a target rate.
+
+Updates are put into the `update_queue` of the application built in
+`birthday_bot`, the way polling and the webhook server deliver them, so they go
+through `PerUserUpdateProcessor` and all handlers. The bot is a `FakeBot` and the
+api is the in-process `StubApi`.
+
+The load is open-loop: updates are sent at `--rate` per second whether or not the
+bot keeps up, so past the saturation point the latency keeps growing during the
+run. Every simulated user is in one conversation at a time, picked from `--mix`,
+and the users' updates are interleaved.
+
+Reported per update:
+- handling: from the first handler until the last one finished
+- end to end: from being queued until handled, includes waiting for the user's
+  previous updates and for a processing slot
+
+Event loop lag is how late a timer firing every 10 ms runs.
+
+Usage:
+    python -m benchmarks.load [--rate N] [--duration S] [--users N] [--size N]
+        [--mix list=4,add=2,change=2,delete=1] [--api-latency S] [--bot-latency S]
+        [--max-concurrency N]
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from benchmarks import updates
+from benchmarks.fake_bot import FakeBot
+from benchmarks.stub_api import BirthdayDataset, StubApi
+from src.birthday_bot import build_application
+from src.core import api_requests
+from src.core.config import config
+
+LAG_INTERVAL = 0.01
+CONVERSATIONS = ("list", "add", "change", "delete")
+DEFAULT_MIX = "list=4,add=2,change=2,delete=1"
+
+
+def parse_mix(mix) -> dict:
+    """Parse weights of the conversations, e.g. "list=4,add=1" """
+    weights = {}
+    for pair in mix.split(","):
+        name, weight = pair.split("=")
+        if name.strip() not in CONVERSATIONS:
+            raise ValueError(f"Unknown conversation {name!r} in the mix")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def _existing_birthday(dataset, user_id, deleted):
+    """Return the id of a random birthday of the user which isn't being deleted"""
+    for _ in range(10):
+        birthday_id = random.randrange(user_id, dataset.size + 1, dataset.users)
+        if birthday_id not in deleted:
+            return birthday_id
+    return birthday_id
+
+
+def conversation(kind, bot, dataset, user_id, deleted) -> list:
+    """Return the updates of a conversation of the user
+
+    Args:
+        kind (str): "list", "add", "change" or "delete"
+        bot (FakeBot): Bot the updates are built for
+        dataset (BirthdayDataset): Birthdays the conversation picks from
+        user_id (int): Telegram id of the user
+        deleted (set): Ids of the birthdays deleted during the replay, a birthday
+          to delete is added to it
+    """
+    if kind == "list":
+        return [updates.message(bot, user_id, "/list")]
+    if kind == "add":
+        return updates.add_conversation(bot, user_id, f"Load {random.getrandbits(32)}")
+
+    birthday_id = _existing_birthday(dataset, user_id, deleted)
+    if kind == "change":
+        return updates.change_conversation(
+            bot, user_id, birthday_id, f"Load {random.getrandbits(32)}"
+        )
+    deleted.add(birthday_id)
+    return updates.delete_conversation(bot, user_id, birthday_id)
+
+
+class LoadStats:
+    """Timestamps of the replayed updates
+
+    Attributes:
+        queued (dict): perf_counter time each update was queued, by update id
+        started (dict): Time the first handler got the update, by update id
+        finished (dict): Time the last handler finished, by update id
+        kinds (dict): Conversation each update belongs to, by update id
+        lags (list): Event loop lags in seconds
+    """
+
+    def __init__(self):
+        self.queued = {}
+        self.started = {}
+        self.finished = {}
+        self.kinds = {}
+        self.lags = []
+
+    async def on_start(self, update, context) -> None:
+        self.started[update.update_id] = time.perf_counter()
+
+    async def on_finish(self, update, context) -> None:
+        self.finished[update.update_id] = time.perf_counter()
+
+    def latencies(self, since, kind=None) -> list:
+        times = since if kind is None else self._of_kind(since, kind)
+        return [
+            self.finished[update_id] - time
+            for update_id, time in times.items()
+            if update_id in self.finished
+        ]
+
+    def _of_kind(self, times, kind) -> dict:
+        return {
+            update_id: time
+            for update_id, time in times.items()
+            if self.kinds[update_id] == kind
+        }
+
+
+async def measure_lag(stats, stop) -> None:
+    """Record how late a timer fires until `stop` is set"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        stats.lags.append(max(0.0, time.perf_counter() - start - LAG_INTERVAL))
+
+
+async def replay(application, bot, dataset, stats, rate, duration, mix) -> int:
+    """Queue updates at `rate` per second for `duration` seconds
+
+    Returns:
+        int: Number of queued updates
+    """
+    names, weights = list(mix), list(mix.values())
+    conversations = {user_id: [] for user_id in range(1, dataset.users + 1)}
+    users = list(conversations)
+    deleted = set()
+
+    interval = 1 / rate
+    start = next_time = time.perf_counter()
+    sent = 0
+    while next_time - start < duration:
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        user_id = random.choice(users)
+        if not conversations[user_id]:
+            kind = random.choices(names, weights)[0]
+            conversations[user_id] = [
+                (kind, update)
+                for update in conversation(kind, bot, dataset, user_id, deleted)
+            ]
+        kind, update = conversations[user_id].pop(0)
+
+        stats.kinds[update.update_id] = kind
+        stats.queued[update.update_id] = time.perf_counter()
+        await application.update_queue.put(update)
+        sent += 1
+        next_time += interval
+
+    return sent
+
+
+def percentiles(values) -> str:
+    if len(values) < 2:
+        return "not enough samples"
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return (
+        f"p50 {cuts[49] * 1000:8.1f} ms, p95 {cuts[94] * 1000:8.1f} ms, "
+        f"p99 {cuts[98] * 1000:8.1f} ms, max {max(values) * 1000:8.1f} ms"
+    )
+
+
+async def main(args) -> None:
+    mix = parse_mix(args.mix)
+    if args.max_concurrency:
+        config.read_dict({"Updates": {"max_concurrency": str(args.max_concurrency)}})
+
+    users = max(1, min(args.users, args.size))
+    dataset = BirthdayDataset(args.size, users)
+    api_requests.api_client = api_requests.create_api_client(
+        transport=StubApi(dataset, latency=args.api_latency)
+    )
+
+    stats = LoadStats()
+    bot = FakeBot(latency=args.bot_latency)
+    application = build_application(bot)
+    # before `resume_reminders` and after all other handlers
+    application.add_handler(TypeHandler(Update, stats.on_start), group=-1000)
+    application.add_handler(TypeHandler(Update, stats.on_finish), group=1000)
+
+    await application.initialize()
+    await application.start()
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_lag(stats, stop))
+
+    start = time.perf_counter()
+    sent = await replay(application, bot, dataset, stats, args.rate, args.duration, mix)
+    sending_time = time.perf_counter() - start
+    try:
+        await asyncio.wait_for(application.update_queue.join(), args.drain_timeout)
+    except asyncio.TimeoutError:
+        print(f"Not all updates were handled {args.drain_timeout} s after the run")
+    elapsed = max(stats.finished.values(), default=start) - start
+
+    stop.set()
+    await lag_task
+    await application.stop()
+    await application.shutdown()
+
+    handled = len(stats.finished)
+    print(
+        f"Sent {sent} updates in {sending_time:.1f} s "
+        f"({sent / sending_time:.1f}/s, target {args.rate:.1f}/s) to {users} users"
+    )
+    print(
+        f"Handled {handled} updates in {elapsed:.1f} s, "
+        f"throughput {handled / elapsed if elapsed else 0:.1f} updates/s"
+    )
+    print(f"handling      {percentiles(stats.latencies(stats.started))}")
+    print(f"end to end    {percentiles(stats.latencies(stats.queued))}")
+    for kind in mix:
+        print(f"  {kind:<11} {percentiles(stats.latencies(stats.queued, kind))}")
+    print(f"event loop lag {percentiles(stats.lags)}")
+
+    per_kind = defaultdict(int)
+    for update_id in stats.queued:
+        if update_id not in stats.finished:
+            per_kind[stats.kinds[update_id]] += 1
+    if per_kind:
+        print(f"Unfinished updates: {dict(per_kind)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=50, help="updates per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=10_000, help="birthdays")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--api-latency", type=float, default=0.05)
+    parser.add_argument("--bot-latency", type=float, default=0.1)
+    parser.add_argument("--max-concurrency", type=int, default=None)
+    parser.add_argument("--drain-timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -0,0 +1,55 @@
+"""Benchmark the cost of logging in users to the api.
+
+Users are logged in against an in-process stub of the api, so only the bot's side
+of the login is measured. Cold logins request the public key and encrypt the bot
+id for every user, cached logins reuse the encrypted bot id of `public_key_cache`.
+
+Usage:
+    python -m benchmarks.login_cost [--users N]
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.stub_api import BirthdayDataset, StubApi
+from src.core import api_requests
+
+
+async def login_users(users, cold) -> tuple:
+    """Log in `users` users one by one, return wall and CPU seconds per user"""
+    api_requests.session_manager.clear()
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+
+    for user_id in range(users):
+        if cold:
+            api_requests.public_key_cache.fingerprint = None
+            api_requests.public_key_cache.encrypted_bot_id = None
+        await api_requests.session_manager.get_session(user_id)
+
+    return (
+        (time.perf_counter() - start_wall) / users,
+        (time.process_time() - start_cpu) / users,
+    )
+
+
+async def main(users) -> None:
+    api_requests.api_client = api_requests.create_api_client(
+        transport=StubApi(BirthdayDataset(size=0, users=1))
+    )
+
+    for name, cold in (("cold", True), ("cached", False)):
+        wall, cpu = await login_users(users, cold)
+        print(
+            f"{name:>6}: {wall * 1000:.3f} ms wall, {cpu * 1000:.3f} ms CPU per login"
+        )
+
+    await api_requests.api_client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.users))
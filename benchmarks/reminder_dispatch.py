@@ -0,0 +1,58 @@
+"""Benchmark sending reminders with `MessageDispatcher`.
+
+Reminders are sent to a fake bot which simulates the latency of the Bot API and
+answers with `RetryAfter` when Telegram's limits are exceeded. Sequential sending,
+the way `reminder()` used to work, is compared to the dispatcher.
+
+Usage:
+    python -m benchmarks.reminder_dispatch [--messages N] [--chats N] [--latency S]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.fake_bot import FakeBot
+from src.core.dispatcher import DispatchSummary, MessageDispatcher
+
+
+async def send_sequentially(bot, messages) -> DispatchSummary:
+    """Send messages one by one without any rate limiting"""
+    summary = DispatchSummary()
+    start = time.monotonic()
+
+    for chat_id, text in messages:
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+            summary.sent += 1
+        except Exception:
+            summary.failed += 1
+
+    summary.duration = time.monotonic() - start
+    return summary
+
+
+async def main(messages, chats, latency) -> None:
+    reminders = [
+        (random.randrange(chats), f"Reminder {number}") for number in range(messages)
+    ]
+
+    bot = FakeBot(latency, rate=30, chat_rate=1)
+    summary = await send_sequentially(bot, reminders)
+    print(f"sequential: {summary}, flood errors: {bot.flood_errors}")
+
+    bot = FakeBot(latency, rate=30, chat_rate=1)
+    dispatcher = MessageDispatcher(bot, max_concurrency=16, rate=30, chat_rate=1)
+    summary = await dispatcher.run(reminders)
+    print(f"dispatcher: {summary}, flood errors: {bot.flood_errors}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.messages, args.chats, args.latency))
@@ -0,0 +1,270 @@
+"""In-process stub of birthday-api
+
+The stub answers the endpoints used by `src.core.api_requests` through an httpx
+transport, so no server or network is involved. Birthdays are derived from their
+id instead of being stored, which keeps datasets of millions of birthdays cheap.
+"""
+
+import asyncio
+import itertools
+import json
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import parse_qs
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+INCOMING_OFFSETS = (0, 1, 7)
+# small, so that items of streamed responses are split between chunks
+CHUNK_SIZE = 256
+
+PUBLIC_KEY_PEM = (
+    rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    .public_key()
+    .public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    .decode("utf-8")
+)
+
+
+class BirthdayDataset:
+    """Birthdays of `users` users, `size` in total
+
+    Birthday `id` belongs to user `(id - 1) % users + 1`, consecutive blocks of
+    `users` ids share a day of the year, the first block is on `start`. Added,
+    changed and deleted birthdays are kept on top of the derived ones.
+
+    Args:
+        size (int): Number of birthdays
+        users (int): Number of users, their Telegram ids are 1 to `users`
+        start (date): Day of the first birthdays, today in UTC by default
+    """
+
+    def __init__(self, size, users, start=None):
+        self.size = size
+        self.users = users
+        start = start or datetime.now(timezone.utc).date()
+        # Feb 29 is skipped, days are counted in a year without it
+        self.start = date(
+            2001, start.month, min(start.day, 28 if start.month == 2 else 31)
+        )
+        self.added = {}
+        self.changed = {}
+        self.deleted = set()
+        self.versions = {}
+        self.next_id = size + 1
+
+    def _derived(self, id) -> dict:
+        day = self.start + timedelta(days=((id - 1) // self.users) % 365)
+        return {
+            "id": id,
+            "name": f"Person {id}",
+            "day": day.day,
+            "month": day.month,
+            "year": 1950 + id % 60 if id % 3 else None,
+            "note": f"Note about person {id}" if id % 4 == 0 else None,
+            "owner": (id - 1) % self.users + 1,
+        }
+
+    def get(self, id):
+        """Return the birthday, `None` if it doesn't exist"""
+        if id in self.deleted:
+            return None
+        if id in self.changed:
+            return self.changed[id]
+        if id in self.added:
+            return self.added[id]
+        if 1 <= id <= self.size:
+            return self._derived(id)
+        return None
+
+    def of_user(self, user_id) -> list:
+        """Return all birthdays of the user"""
+        ids = range(user_id, self.size + 1, self.users) if user_id <= self.users else ()
+        birthdays = [self.get(id) for id in ids]
+        birthdays += [b for b in self.added.values() if b["owner"] == user_id]
+        return [b for b in birthdays if b is not None]
+
+    def incoming(self, today):
+        """Yield birthdays which are today, tomorrow or in a week"""
+        for offset in INCOMING_OFFSETS:
+            day = today + timedelta(days=offset)
+            if (day.month, day.day) == (2, 29):
+                continue
+            block = (date(2001, day.month, day.day) - self.start).days % 365
+            first_ids = range(block * self.users + 1, self.size + 1, 365 * self.users)
+            ids = (
+                id
+                for first_id in first_ids
+                for id in range(first_id, min(first_id + self.users, self.size + 1))
+            )
+            extra = (
+                b["id"]
+                for b in (*self.added.values(), *self.changed.values())
+                if (b["month"], b["day"]) == (day.month, day.day)
+            )
+            # a changed birthday may be both derived and in `changed`
+            for id in dict.fromkeys((*ids, *extra)):
+                birthday = self.get(id)
+                if birthday and (birthday["month"], birthday["day"]) == (
+                    day.month,
+                    day.day,
+                ):
+                    yield {**birthday, "incoming_in_days": offset}
+
+    def add(self, user_id, data) -> dict:
+        birthday = {**data, "id": self.next_id, "owner": user_id}
+        self.added[self.next_id] = birthday
+        self.next_id += 1
+        self._touch(user_id)
+        return birthday
+
+    def change(self, id, data) -> None:
+        birthday = {**self.get(id), **data}
+        self.changed[id] = birthday
+        self._touch(birthday["owner"])
+
+    def delete(self, id) -> None:
+        self._touch(self.get(id)["owner"])
+        self.deleted.add(id)
+
+    def _touch(self, user_id) -> None:
+        self.versions[user_id] = self.versions.get(user_id, 0) + 1
+
+    def etag(self, user_id) -> str:
+        return f'"{user_id}-{self.versions.get(user_id, 0)}"'
+
+
+class StubApi(httpx.AsyncBaseTransport):
+    """httpx transport which answers like birthday-api
+
+    Args:
+        dataset (BirthdayDataset): Birthdays served by the stub
+        latency (float): Seconds every request takes
+        chunk_size (int): Size in bytes of the chunks incoming birthdays are
+          streamed in, they are generated while the response is read
+
+    Attributes:
+        requests (dict): Number of requests by "METHOD /path", ids replaced
+    """
+
+    def __init__(self, dataset, latency=0.0, chunk_size=CHUNK_SIZE):
+        self.dataset = dataset
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.requests = {}
+
+    async def handle_async_request(self, request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        path = request.url.path
+        parts = path.strip("/").split("/")
+        route = f"{request.method} /" + "/".join(
+            "{id}" if part.isdigit() else part for part in parts
+        )
+        self.requests[route] = self.requests.get(route, 0) + 1
+
+        if route == "GET /public-key":
+            return _json(200, {"public_key": PUBLIC_KEY_PEM})
+        if route == "GET /login":
+            return _login(request.url.params["id"])
+        if route == "GET /admin/login":
+            return _login("admin")
+
+        user = _user(request)
+        if user is None:
+            return _json(401, {"msg": "Missing cookie"})
+
+        if route == "GET /admin/birthdays/incoming":
+            incoming = self.dataset.incoming(datetime.now(timezone.utc).date())
+            first = next(incoming, None)
+            if first is None:
+                return _json(404, {"msg": "No incoming birthdays"})
+            return httpx.Response(
+                200,
+                headers={"Content-Type": "application/json"},
+                content=_stream_array(
+                    map(_incoming, itertools.chain([first], incoming)),
+                    self.chunk_size,
+                ),
+            )
+
+        user_id = int(user)
+        if route == "GET /birthdays":
+            etag = self.dataset.etag(user_id)
+            if request.headers.get("If-None-Match") == etag:
+                return httpx.Response(304, headers={"ETag": etag})
+            birthdays = [_public(b) for b in self.dataset.of_user(user_id)]
+            if not birthdays:
+                return _json(404, {"msg": "No birthdays"})
+            return _json(200, birthdays, {"ETag": etag})
+        if route == "POST /birthdays":
+            birthday = self.dataset.add(user_id, json.loads(request.content))
+            return _json(201, {"id": birthday["id"]})
+
+        birthday = self.dataset.get(int(parts[-1])) if parts[-1].isdigit() else None
+        if birthday is None or birthday["owner"] != user_id:
+            return _json(404, {"msg": "Not found"})
+        if route == "GET /birthdays/{id}":
+            return _json(200, _public(birthday))
+        if route == "PUT /birthdays/{id}":
+            self.dataset.change(birthday["id"], json.loads(request.content))
+            return _json(200, {"msg": "Updated"})
+        if route == "DELETE /birthdays/{id}":
+            self.dataset.delete(birthday["id"])
+            return _json(200, {"msg": "Deleted"})
+
+        return _json(404, {"msg": f"No route {route}"})
+
+
+def _incoming(birthday) -> dict:
+    return {
+        "id": birthday["id"],
+        "name": birthday["name"],
+        "day": birthday["day"],
+        "month": birthday["month"],
+        "year": birthday["year"],
+        "note": birthday["note"],
+        "incoming_in_days": birthday["incoming_in_days"],
+        "creator": {"telegram_id": birthday["owner"]},
+    }
+
+
+async def _stream_array(items, chunk_size):
+    """Yield the JSON array of the items in chunks of `chunk_size` bytes"""
+    pending = b"["
+    for number, item in enumerate(items):
+        pending += (b"," if number else b"") + json.dumps(item).encode()
+        while len(pending) >= chunk_size:
+            yield pending[:chunk_size]
+            pending = pending[chunk_size:]
+            # let other tasks run, like a slow network would
+            await asyncio.sleep(0)
+    yield pending + b"]"
+
+
+def _json(status_code, data, headers=None) -> httpx.Response:
+    return httpx.Response(status_code, json=data, headers=headers)
+
+
+def _login(user) -> httpx.Response:
+    return httpx.Response(
+        200,
+        json={"msg": "ok"},
+        headers=[
+            ("Set-Cookie", f"access_token_cookie={user}; Path=/"),
+            ("Set-Cookie", f"csrf_access_token=csrf-{user}; Path=/"),
+        ],
+    )
+
+
+def _user(request):
+    cookies = parse_qs(request.headers.get("Cookie", "").replace("; ", "&"))
+    return cookies.get("access_token_cookie", [None])[0]
+
+
+def _public(birthday) -> dict:
+    return {key: value for key, value in birthday.items() if key != "owner"}
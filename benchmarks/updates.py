@@ -0,0 +1,82 @@
+"""Builders of the updates a user sends during the bot's conversations"""
+
+import itertools
+import time
+
+from telegram import Update
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def _user(user_id) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+
+def _message(user_id, text) -> dict:
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(command)}
+        ]
+    return message
+
+
+def message(bot, user_id, text) -> Update:
+    """Return an update with a private message, a command if it starts with "/" """
+    return Update.de_json(
+        {"update_id": next(_update_ids), "message": _message(user_id, text)}, bot
+    )
+
+
+def callback_query(bot, user_id, data) -> Update:
+    """Return an update with a press of an inline keyboard button"""
+    return Update.de_json(
+        {
+            "update_id": next(_update_ids),
+            "callback_query": {
+                "id": str(next(_update_ids)),
+                "from": _user(user_id),
+                "chat_instance": str(user_id),
+                "message": _message(user_id, "Choose a birthday:"),
+                "data": str(data),
+            },
+        },
+        bot,
+    )
+
+
+def add_conversation(bot, user_id, name, note=None) -> list:
+    """Return the updates of adding a birthday with /add"""
+    return [
+        message(bot, user_id, "/add"),
+        message(bot, user_id, name),
+        message(bot, user_id, "14.03.1990"),
+        message(bot, user_id, note) if note else message(bot, user_id, "/skip"),
+    ]
+
+
+def change_conversation(bot, user_id, birthday_id, name) -> list:
+    """Return the updates of renaming a birthday and moving it with /change"""
+    return [
+        message(bot, user_id, "/change"),
+        callback_query(bot, user_id, birthday_id),
+        message(bot, user_id, name),
+        message(bot, user_id, "15.03"),
+        message(bot, user_id, "/skip"),
+    ]
+
+
+def delete_conversation(bot, user_id, birthday_id) -> list:
+    """Return the updates of deleting a birthday with /delete"""
+    return [
+        message(bot, user_id, "/delete"),
+        callback_query(bot, user_id, birthday_id),
+    ]
@@ -117,6 +117,10 @@
                 ExecStart =
                   "${self.packages.${system}.default}/bin/birthday-bot";
 
+                # the local database defaults to a path relative to this
+                StateDirectory = "birthday-bot";
+                WorkingDirectory = "/var/lib/birthday-bot";
+
                 Type = "simple";
                 Restart = "on-failure";
               };
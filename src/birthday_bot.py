@@ -1,57 +1,174 @@
+import logging
 from datetime import time
 from warnings import filterwarnings
 
 import pytz
 from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler
+from telegram.ext import (
+    Application,
+    ApplicationBuilder,
+    CommandHandler,
+    ContextTypes,
+    TypeHandler,
+)
 from telegram.warnings import PTBUserWarning
 
 import src.core.logger
-from src.handlers.reminder import reminder
+from src.core.api_requests import api_client, response_cache, session_manager
+from src.core.metrics import metrics_server
+from src.core.update_processor import PerUserUpdateProcessor
+from src.handlers.reminder import (
+    catch_up_reminders,
+    prefetch_reminders,
+    reminder,
+    resume_reminders,
+)
 
 filterwarnings(
     action="ignore", message=r".*CallbackQueryHandler", category=PTBUserWarning
 )
 
-from src.core.config import BOT_TOKEN
+from src.core.config import BOT_TOKEN, config
 from src.handlers.add import add_conv_handler
 from src.handlers.change import change_conv_handler
 from src.handlers.delete import delete_conv_handler
 from src.handlers.list import list_birthdays
+from src.handlers.settings import set_reminder_hour, set_timezone
+from src.handlers.snapshot import sweep_snapshots
 from src.handlers.start import start
 
+# commands whose handling time is recorded in the metrics by name
+COMMANDS = (
+    "start",
+    "list",
+    "add",
+    "change",
+    "delete",
+    "timezone",
+    "reminder_hour",
+    "skip",
+    "delete_note",
+    "stop",
+)
+
 
 def main() -> None:
     """BirthdayBot main function.
 
     Create and start polling an application with handlers for manipulating birthdays using
     [birthday-api](https://github.com/orehzzz/birthday-api).
+    Updates of different users are handled concurrently, each user's in order.
 
-    Send a daily reminder about the birthdays
+    Send a daily reminder about the birthdays at the hour chosen by each user
     """
 
-    application = ApplicationBuilder().token(BOT_TOKEN).post_init(post_init).build()
+    application = build_application()
+    schedule_jobs(application)
+
+    if config.getboolean("Webhook", "enabled", fallback=False):
+        run_webhook(application)
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+
+def build_application(bot=None) -> Application:
+    """Create the application with the update processor and all handlers.
 
+    Args:
+        bot (telegram.Bot): Bot to use instead of one created from `BOT_TOKEN`,
+          e.g. a fake bot in the benchmarks
+
+    Returns:
+        Application: Application ready to be run, without scheduled jobs
+    """
+    builder = ApplicationBuilder()
+    builder = builder.bot(bot) if bot is not None else builder.token(BOT_TOKEN)
+    application = (
+        builder.concurrent_updates(
+            PerUserUpdateProcessor(
+                max_concurrency=config.getint(
+                    "Updates", "max_concurrency", fallback=32
+                ),
+                max_pending=config.getint("Updates", "max_pending", fallback=1024),
+                commands=COMMANDS,
+                slow_update=config.getfloat("Updates", "slow_update", fallback=1.0),
+            )
+        )
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+
+    # runs before the other handlers for every update
+    application.add_handler(TypeHandler(Update, resume_reminders), group=-1)
     application.add_handler(CommandHandler("start", start))
     application.add_handler(add_conv_handler)
     application.add_handler(change_conv_handler)
     application.add_handler(delete_conv_handler)
     application.add_handler(CommandHandler("list", list_birthdays))
+    application.add_handler(CommandHandler("timezone", set_timezone))
+    application.add_handler(CommandHandler("reminder_hour", set_reminder_hour))
 
+    return application
+
+
+def schedule_jobs(application) -> None:
+    """Schedule the reminder and maintenance jobs of the application"""
     job_queue = application.job_queue
+    # every hour, each run sends reminders only to users whose reminder hour it is
+    for hour in range(24):
+        job_queue.run_daily(callback=reminder, time=time(hour=hour, tzinfo=pytz.utc))
+    # reminders of the day are prepared in advance at an off-peak hour
     job_queue.run_daily(
-        callback=reminder,
-        time=time(hour=10, tzinfo=pytz.timezone("Europe/Kyiv")),
+        callback=prefetch_reminders,
+        time=time(
+            hour=config.getint("Reminder", "prefetch_hour", fallback=3),
+            tzinfo=pytz.utc,
+        ),
+    )
+    # reminders missed while the bot was down
+    job_queue.run_once(
+        callback=catch_up_reminders,
+        when=config.getint("Reminder", "catch_up_delay", fallback=60),
     )
+    job_queue.run_repeating(
+        callback=sweep_caches,
+        interval=config.getint("Api", "session_sweep_interval", fallback=5 * 60),
+    )
+
 
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+def run_webhook(application) -> None:
+    """Receive updates with an embedded web server instead of polling.
+
+    Telegram is told to post updates to `[Webhook] url`, the server listens on
+    `listen`:`port` and rejects requests without the `secret_token` header.
+    """
+    secret_token = config.get("Webhook", "secret_token", fallback=None)
+    if not secret_token:
+        logging.warning(
+            "Webhook secret_token is not set, anyone can post updates to the bot"
+        )
+
+    application.run_webhook(
+        listen=config.get("Webhook", "listen", fallback="127.0.0.1"),
+        port=config.getint("Webhook", "port", fallback=8443),
+        url_path=config.get("Webhook", "url_path", fallback=""),
+        webhook_url=config.get("Webhook", "url", fallback=None),
+        secret_token=secret_token or None,
+        allowed_updates=Update.ALL_TYPES,
+    )
 
 
 async def post_init(application: ApplicationBuilder) -> None:
     """Post initialization function for the bot.
 
-    Set bot's name, short/long description and commands.
+    Restore api sessions, start the metrics endpoint if it's enabled and set bot's
+    name, short/long description and commands.
     """
+    session_manager.restore()
+    if metrics_server:
+        await metrics_server.start()
+
     # Comment this if you need to restart the bot several times
     await application.bot.set_my_name("BirthdayBot")
     await application.bot.set_my_short_description("To remember everyone's birthday!")
@@ -68,6 +185,8 @@ async def post_init(application: ApplicationBuilder) -> None:
             ("add", "add a birthday"),
             ("change", "change a birthday"),
             ("delete", "delete a birthday"),
+            ("timezone", "set your timezone for reminders"),
+            ("reminder_hour", "set the hour to get reminders at"),
             (
                 "skip",
                 "skip the current action (if possible) during /add or /change commands",
@@ -77,5 +196,27 @@ async def post_init(application: ApplicationBuilder) -> None:
     )
 
 
+async def sweep_caches(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Remove expired api sessions, cached responses and birthday snapshots
+
+    A callback function for the `job_queue`.
+    """
+    session_manager.sweep()
+    response_cache.sweep()
+    sweep_snapshots(context.application.user_data)
+
+
+async def post_shutdown(application: ApplicationBuilder) -> None:
+    """Post shutdown function for the bot.
+
+    Drop api sessions, close the connections to the api and stop the metrics
+    endpoint.
+    """
+    session_manager.clear()
+    await api_client.aclose()
+    if metrics_server:
+        await metrics_server.stop()
+
+
 if __name__ == "__main__":
     main()
@@ -1,16 +1,25 @@
+import asyncio
 import base64
+import hashlib
 import logging
-from time import time
+from collections import OrderedDict
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from time import perf_counter, time
 
-import requests
+import httpx
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding
-from requests import RequestException
 
+from src.core import metrics, tracing
+from src.core.cache import ResponseCache, conditional_headers
 from src.core.config import BOT_TOKEN, config
+from src.core.json_stream import JSONArrayParser
+from src.core.log_format import summarize
+from src.core.session_store import SessionStore
 
-PUBLIC_KEY = None
 JWT_EXPIRES_SECONDS = 60 * 60
+CACHEABLE_STATUS_CODES = (200, 404)
+ADMIN_STORE_ID = "admin"
 
 
 class SessionManager:
@@ -19,153 +28,520 @@ class SessionManager:
     Should be used to get sessions by id. If the session doesn't exist or has expired,
     a new session is created.
 
+    Sessions are kept in least recently used order. When there are more than
+    `max_size` sessions, the least recently used ones are evicted. Expired sessions
+    are removed by `sweep()`, which should be called periodically.
+
+    If a `store` is given, logged in sessions are saved to it and can be restored
+    with `restore()` after a restart. Restored sessions are validated lazily: if the
+    api rejects one, it is replaced with a new session.
+
+    Args:
+        max_size (int): Maximum number of sessions to keep
+        store (SessionStore): Store to persist sessions to, optional
+
     Attributes:
-        sessions (dict): Dictionary to store sessions with their ids as keys
+        sessions (OrderedDict): Sessions with their ids as keys, least recently
+          used first
+        max_size (int): Maximum number of sessions to keep
+        store (SessionStore): Store to persist sessions to, can be `None`
+        hits (int): Number of times a valid session was reused
+        misses (int): Number of times a session had to be created
+        evictions (int): Number of sessions evicted to stay within `max_size`
+        pending_logins (dict): Logins in progress with session ids as keys
 
     """
 
-    def __init__(self):
-        self.sessions = {}
+    def __init__(self, max_size=1000, store=None):
+        self.sessions = OrderedDict()
+        self.max_size = max_size
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.pending_logins = {}
 
-    def get_session(self, id):
+    async def get_session(self, id):
         """Get session by id.
 
-        Create a new session if it doesn't exist or has expired."""
-        if id not in self.sessions or self.sessions[id].is_expired():
-            if id == BOT_TOKEN:
-                logging.info("Creating admin session")
-                self.sessions[id] = AdminSession()
+        Create a new session if it doesn't exist or has expired. Concurrent calls
+        for the same id share a single login."""
+        session = self.sessions.get(id)
+        if session is not None and not session.is_expired():
+            self.hits += 1
+            self.sessions.move_to_end(id)
+            return session
+
+        pending_login = self.pending_logins.get(id)
+        if pending_login is None:
+            self.misses += 1
+            pending_login = asyncio.ensure_future(self._create_session(id))
+            self.pending_logins[id] = pending_login
+            pending_login.add_done_callback(lambda _: self.pending_logins.pop(id, None))
+        else:
+            logging.debug("Waiting for pending login of session with id: %s", id)
+
+        # shield the login, so a cancelled caller doesn't cancel it for the others
+        return await asyncio.shield(pending_login)
+
+    async def _create_session(self, id):
+        """Create and login a new session, store it and evict the least recently
+        used sessions if there are too many of them."""
+        if id == BOT_TOKEN:
+            logging.info("Creating admin session")
+            session = AdminSession()
+        else:
+            logging.info("Creating user session with id: %s", id)
+            session = CustomSession(id)
+
+        try:
+            await session.login(await public_key_cache.get_encrypted_bot_id())
+        except httpx.HTTPError:
+            # the api might have rotated its key, retry only if it did
+            if not await public_key_cache.refresh():
+                raise
+            await session.login(await public_key_cache.get_encrypted_bot_id())
+
+        self.sessions.pop(id, None)
+        self.sessions[id] = session
+        if self.store is not None:
+            self.store.save(_store_id(id), session.cookies, session.time_created)
+
+        while len(self.sessions) > self.max_size:
+            evicted_id, _ = self.sessions.popitem(last=False)
+            self.evictions += 1
+            logging.debug("Evicting session with id: %s", evicted_id)
+
+        return session
+
+    def sweep(self):
+        """Remove all expired sessions"""
+        expired_ids = [
+            id for id, session in self.sessions.items() if session.is_expired()
+        ]
+        for id in expired_ids:
+            del self.sessions[id]
+        if self.store is not None:
+            self.store.delete_expired()
+
+        logging.info(
+            f"Swept {len(expired_ids)} expired sessions. Sessions: {len(self.sessions)}, "
+            f"hits: {self.hits}, misses: {self.misses}, evictions: {self.evictions}"
+        )
+
+    def invalidate(self, id, session):
+        """Remove `session` if it's still the current session for `id`"""
+        if self.sessions.get(id) is session:
+            del self.sessions[id]
+
+    def restore(self):
+        """Restore sessions which haven't expired yet from the store"""
+        if self.store is None:
+            return
+
+        for store_id, cookies, time_created in self.store.load(self.max_size):
+            if store_id == ADMIN_STORE_ID:
+                session = AdminSession()
             else:
-                logging.info(f"Creating user session with id: {id}")
-                self.sessions[id] = CustomSession(id)
+                session = CustomSession(int(store_id))
+
+            for cookie in cookies:
+                session.cookies.set(**cookie)
+            session.headers["X-CSRF-TOKEN"] = session.cookies["csrf_access_token"]
+            session.time_created = time_created
+            session.restored = True
 
-        return self.sessions[id]
+            self.sessions[session.id] = session
 
+    def clear(self):
+        """Remove all sessions"""
+        self.sessions.clear()
 
-session_manager = SessionManager()
 
+class PublicKeyCache:
+    """Class to cache the api's public key and the bot id encrypted with it
 
-class CustomSession(requests.Session):
-    """Extend `requests.Session` class with custom properties and methods.
+    The encrypted bot id is reused for every login until the key is refreshed.
+    The key is requested again once it's older than `max_age` or when `refresh()` is
+    called, e.g. after a failed login. The bot id is encrypted again only if the
+    fingerprint of the key has changed.
 
     Args:
-        id: id of the session. Should be user's id or bot's token
+        max_age (int): Number of seconds after which the key is requested again
 
     Attributes:
-        id: id of the session
-        time_created: Time when the session was created
-        hooks: List of hooks to be executed before or after the request
+        max_age (int): Number of seconds after which the key is requested again
+        fingerprint (str): SHA-256 hex digest of the cached key in PEM format
+        encrypted_bot_id (str): Bot token encrypted with the cached key, base64 encoded
+        time_fetched (float): Time when the key was requested last
     """
 
-    def __init__(self, id):
-        super().__init__()
-        self.id = id
-        self.time_created = time()
-        self.login(self._encrypt_bot_id())
-        self.hooks["response"].append(self.pre_request_hook)
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.fingerprint = None
+        self.encrypted_bot_id = None
+        self.time_fetched = 0
+        self._pending_refresh = None
 
     def is_expired(self) -> bool:
-        """Check if the session has expired"""
-        return time() - self.time_created > JWT_EXPIRES_SECONDS
+        """Check if the cached key should be requested again"""
+        return time() - self.time_fetched > self.max_age
 
-    def login(self, encrypted_bot_id) -> bool:
-        """Login to the api with the given `encrypted_bot_id`.
+    async def get_encrypted_bot_id(self) -> str:
+        """Return the encrypted bot id, refresh the key first if needed.
 
-        Args:
-            encrypted_bot_id (str): Bot's id encrypted with the `PUBLIC_KEY`
+        Raises:
+            httpx.HTTPError: Raised if the public key request to the api failed
+
+        Returns:
+            str: Encrypted bot token as a base64 string
+        """
+        if self.encrypted_bot_id is None or self.is_expired():
+            await self.refresh()
+
+        return self.encrypted_bot_id
+
+    async def refresh(self) -> bool:
+        """Request the public key, encrypt the bot id again if the key has changed.
+
+        Concurrent calls share a single request.
 
         Raises:
-            RequestException: Raised if request to the api failed
+            httpx.HTTPError: Raised if the public key request to the api failed
 
         Returns:
-            bool: True if login was successful
+            bool: True if the key has changed
         """
-        try:
-            login_response = self.get(
-                f"{config.get('Api', 'base_url')}/login",
-                params={"encrypted_bot_id": encrypted_bot_id, "id": self.id},
+        if self._pending_refresh is None:
+            self._pending_refresh = asyncio.ensure_future(self._refresh())
+            self._pending_refresh.add_done_callback(
+                lambda _: setattr(self, "_pending_refresh", None)
             )
-            login_response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Failed to login user {self.id} to the api: {e}.")
-            raise RequestException("Failed to login to api")
 
-        csrf_access_token = self.cookies["csrf_access_token"]
+        return await asyncio.shield(self._pending_refresh)
 
-        self.headers.update({"X-CSRF-TOKEN": csrf_access_token})
+    async def _refresh(self) -> bool:
+        try:
+            with tracing.span("GET /public-key"):
+                response = await api_client.get(
+                    f"{config.get('Api', 'base_url')}/public-key",
+                    headers={tracing.CORRELATION_HEADER: tracing.correlation_id.get()},
+                )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logging.error(f"Failed to request public key: {e}")
+            raise httpx.HTTPError("Failed to request public key")
+
+        public_key_pem = response.json()["public_key"].encode("utf-8")
+        fingerprint = hashlib.sha256(public_key_pem).hexdigest()
+        self.time_fetched = time()
+
+        if fingerprint == self.fingerprint:
+            logging.info("Public key hasn't changed")
+            return False
+
+        public_key = serialization.load_pem_public_key(public_key_pem)
+        # RSA encryption is CPU bound, keep it off the event loop
+        self.encrypted_bot_id = await asyncio.to_thread(_encrypt_bot_id, public_key)
+        self.fingerprint = fingerprint
 
-        logging.info(f"User with id: {self.id} successfully logged in to the api")
+        logging.info(f"Public key with fingerprint {fingerprint} successfully received")
         return True
 
-    # do i need response?
-    def pre_request_hook(self, response, *args, **kwargs):
-        """Function to be executed before each request.
 
-        Check if the session has expired and relogins if needed.
+def _encrypt_bot_id(public_key) -> str:
+    """Encrypt bot token with the public key and return it as a base64 string
 
-        """
+    Args:
+        public_key (cryptography.hazmat.primitives.asymmetric.rsa.RSAPublicKey):
+          Public key of the api
 
-        if self.is_expired():
-            logging.info(f"Session with id: {self.id} has expired. Relogging")
-            self.login(self._encrypt_bot_id())
+    Returns:
+        str: Encrypted bot token as a base64 string
 
-    def _get_public_key(self):
-        """Request public key from the api and return it as a cryptography object
+    """
+    encrypted_data = public_key.encrypt(
+        BOT_TOKEN.encode("utf-8"),
+        padding.OAEP(
+            mgf=padding.MGF1(algorithm=hashes.SHA256()),
+            algorithm=hashes.SHA256(),
+            label=None,
+        ),
+    )
+    return base64.b64encode(encrypted_data).decode("utf-8")
 
-        Raises:
-            RequestException: Raised if the request to the api failed
 
-        Returns:
-            cryptography.hazmat.primitives.asymmetric.rsa.RSAPublicKey:
-            Public key as a cryptography object
+def create_api_client(**kwargs) -> httpx.AsyncClient:
+    """Create a client for the api with the pool settings from the config.
+
+    Cookies are kept per session, so the client doesn't store any of them.
+
+    Args:
+        **kwargs: additional arguments for `httpx.AsyncClient`
+
+    Returns:
+        httpx.AsyncClient: Client to send all requests to the api through
+    """
+    return httpx.AsyncClient(
+        cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+        limits=httpx.Limits(
+            max_connections=config.getint("Api", "pool_size", fallback=100),
+            max_keepalive_connections=config.getint(
+                "Api", "keepalive_connections", fallback=20
+            ),
+            keepalive_expiry=config.getfloat("Api", "keepalive_expiry", fallback=30),
+        ),
+        **kwargs,
+    )
+
+
+def _store_id(id) -> str:
+    """Return id of the session in the store, the bot token is never stored"""
+    return ADMIN_STORE_ID if id == BOT_TOKEN else str(id)
+
+
+async def _session_request(id, method, url, **kwargs) -> httpx.Response:
+    """Send a request with the session of the given id.
+
+    If the session was restored from the store and the api rejects it, login again
+    and repeat the request.
+
+    Args:
+        id: id of the session
+        method (str): HTTP method
+        url (str): url of the request
+        **kwargs: arguments for `CustomSession.request`
+
+    Returns:
+        httpx.Response: Response object of the request
+    """
+    session = await session_manager.get_session(id)
+    response = await session.request(method, url, **kwargs)
+
+    if response.status_code == 401 and session.restored:
+        logging.info("Restored session with id: %s was rejected", session.id)
+        await response.aclose()
+        session_manager.invalidate(id, session)
+        session = await session_manager.get_session(id)
+        response = await session.request(method, url, **kwargs)
+
+    session.restored = False
+    return response
+
+
+async def _cached_get_request(user_id, url) -> httpx.Response:
+    """Send a get request with the user's session, use `response_cache` if possible.
+
+    Fresh responses are returned from the cache. Expired ones are revalidated with
+    a conditional request, and returned again if the api answers with
+    `304 Not Modified`.
 
+    Args:
+        user_id (str): id of the user
+        url (str): url of the request
+
+    Returns:
+        httpx.Response: Response object of the get request
+    """
+    response = response_cache.get(user_id, url)
+    if response is not None:
+        logging.info("Serving cached response of %s for user: %s", url, user_id)
+        return response
+
+    headers = conditional_headers(response_cache.get_stale(user_id, url))
+    response = await _session_request(user_id, "GET", url, headers=headers)
+
+    if response.status_code == 304:
+        stale_response = response_cache.revalidate(user_id, url)
+        if stale_response is not None:
+            logging.info("Cached response of %s for user: %s is valid", url, user_id)
+            return stale_response
+
+    if response.status_code in CACHEABLE_STATUS_CODES:
+        response_cache.put(user_id, url, response)
+
+    return response
+
+
+api_client = create_api_client()
+
+session_manager = SessionManager(
+    max_size=config.getint("Api", "session_cache_size", fallback=1000),
+    store=(
+        SessionStore(expires_seconds=JWT_EXPIRES_SECONDS)
+        if config.getboolean("Api", "persist_sessions", fallback=False)
+        else None
+    ),
+)
+
+response_cache = ResponseCache(
+    ttl=config.getint("Cache", "ttl", fallback=60),
+    stale_ttl=config.getint("Cache", "stale_ttl", fallback=60 * 60),
+    max_entries=config.getint("Cache", "max_entries", fallback=10000),
+    max_bytes=config.getint("Cache", "max_bytes", fallback=64 * 1024 * 1024),
+)
+
+public_key_cache = PublicKeyCache(
+    max_age=config.getint("Api", "public_key_max_age", fallback=24 * 60 * 60)
+)
+
+for name, documentation, callback, kind in (
+    (
+        "sessions",
+        "Api sessions in memory",
+        lambda: len(session_manager.sessions),
+        "gauge",
+    ),
+    (
+        "session_hits_total",
+        "Requests served by a cached session",
+        lambda: session_manager.hits,
+        "counter",
+    ),
+    (
+        "session_misses_total",
+        "Requests which needed a new session",
+        lambda: session_manager.misses,
+        "counter",
+    ),
+    (
+        "session_evictions_total",
+        "Sessions evicted from the cache",
+        lambda: session_manager.evictions,
+        "counter",
+    ),
+    (
+        "cached_responses",
+        "Responses in the response cache",
+        lambda: len(response_cache.entries),
+        "gauge",
+    ),
+    (
+        "cached_response_bytes",
+        "Size of the cached responses",
+        lambda: response_cache.size,
+        "gauge",
+    ),
+):
+    metrics.registry.register(
+        metrics.Gauge(f"birthdaybot_api_{name}", documentation, callback, kind=kind)
+    )
+
+
+class CustomSession:
+    """Api session of a user.
+
+    Holds the auth state of the user (JWT cookies and the CSRF header) and attaches
+    it to each request. Requests are sent through the shared `api_client`, so all
+    sessions reuse the same connection pool.
+
+    The session is not logged in on creation, `login()` has to be awaited before
+    making requests. `SessionManager` takes care of that.
+
+    Args:
+        id: id of the session. Should be user's id or bot's token
+
+    Attributes:
+        id: id of the session
+        time_created: Time when the session was logged in
+        cookies (httpx.Cookies): Cookies set by the api for this session
+        headers (httpx.Headers): Headers sent with each request of this session
+        restored (bool): True if the session was restored from the store and the
+          api hasn't accepted it yet
+    """
+
+    def __init__(self, id):
+        self.id = id
+        self.time_created = time()
+        self.cookies = httpx.Cookies()
+        self.headers = httpx.Headers()
+        self.restored = False
+
+    async def request(self, method, url, stream=False, **kwargs) -> httpx.Response:
+        """Send a request through `api_client` with the auth state of the session.
+
+        The correlation id of the current update or job is sent in the
+        `X-Correlation-ID` header, and the request is timed as a span of its trace.
+
+        Args:
+            method (str): HTTP method
+            url (str): url of the request
+            stream (bool): If True, the body is not read. The response has to be
+              closed with `aclose()` by the caller
+            **kwargs: arguments for `httpx.AsyncClient.build_request`
+
+        Returns:
+            httpx.Response: Response object of the request
         """
+        headers = httpx.Headers(self.headers)
+        headers.update(kwargs.pop("headers", None) or {})
+        headers[tracing.CORRELATION_HEADER] = tracing.correlation_id.get()
+
+        request = api_client.build_request(method, url, headers=headers, **kwargs)
+        self.cookies.set_cookie_header(request)
+
+        labels = {"method": method, "endpoint": metrics.endpoint(request.url)}
+        start = perf_counter()
         try:
-            response = requests.get(f"{config.get('Api', 'base_url')}/public-key")
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Failed to request public key: {e}")
-            raise RequestException("Failed to request public key")
+            with tracing.span(f"{method} {labels['endpoint']}"):
+                response = await api_client.send(request, stream=stream)
+        except httpx.HTTPError:
+            metrics.api_requests.inc(status="error", **labels)
+            raise
+        finally:
+            metrics.api_request_duration.observe(perf_counter() - start, **labels)
+        metrics.api_requests.inc(status=response.status_code, **labels)
+        self.cookies.extract_cookies(response)
 
-        public_key_json = response.json()
-        public_key = serialization.load_pem_public_key(
-            public_key_json["public_key"].encode("utf-8")
-        )
+        return response
+
+    async def get(self, url, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
 
-        logging.info("Public key successfully received")
-        return public_key
+    async def delete(self, url, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
 
-    def _encrypt_bot_id(self, request_key=False):
-        """Encrypt bot token with the public key and return it as a base64 string
+    def is_expired(self) -> bool:
+        """Check if the session has expired"""
+        return time() - self.time_created > JWT_EXPIRES_SECONDS
+
+    async def login(self, encrypted_bot_id) -> bool:
+        """Login to the api with the given `encrypted_bot_id`.
 
         Args:
-            request_key (bool): If True, requests the public key from the api. Else,
-              tries to use the cached key.
+            encrypted_bot_id (str): Bot's id encrypted with the api's public key
 
         Raises:
-            RequestException: Raised if the public key request to the api failed
+            httpx.HTTPError: Raised if request to the api failed
 
         Returns:
-            str: Encrypted bot token as a base64 string
-
+            bool: True if login was successful
         """
-        global PUBLIC_KEY
+        try:
+            login_response = await self.get(
+                f"{config.get('Api', 'base_url')}/login",
+                params={"encrypted_bot_id": encrypted_bot_id, "id": self.id},
+            )
+            login_response.raise_for_status()
+        except httpx.HTTPError as e:
+            logging.error(f"Failed to login user {self.id} to the api: {e}.")
+            metrics.api_logins.inc(session="user", result="failure")
+            raise httpx.HTTPError("Failed to login to api")
 
-        if PUBLIC_KEY is None or request_key:
-            PUBLIC_KEY = self._get_public_key()
+        csrf_access_token = self.cookies["csrf_access_token"]
 
-        encrypted_data = PUBLIC_KEY.encrypt(
-            BOT_TOKEN.encode("utf-8"),
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None,
-            ),
-        )
-        encrypted_data_base64 = base64.b64encode(encrypted_data).decode("utf-8")
+        self.headers.update({"X-CSRF-TOKEN": csrf_access_token})
+        self.time_created = time()
 
-        logging.info("Bot id successfully encrypted")
-        return encrypted_data_base64
+        logging.info("User with id: %s successfully logged in to the api", self.id)
+        metrics.api_logins.inc(session="user", result="success")
+        return True
 
 
 class AdminSession(CustomSession):
@@ -174,36 +550,39 @@ class AdminSession(CustomSession):
     def __init__(self):
         super().__init__(BOT_TOKEN)
 
-    def login(self, encrypted_bot_id) -> bool:
+    async def login(self, encrypted_bot_id) -> bool:
         """Logs in session to the api as admin with the given `encrypted_bot_id`
 
         Args:
             encrypted_bot_id (str): Bot id encrypted with the public key
 
         Raises:
-            RequestException: Raised if the request to the api failed
+            httpx.HTTPError: Raised if the request to the api failed
 
         Returns:
             bool: True if the login was successful
         """
         try:
-            login_response = self.get(
+            login_response = await self.get(
                 f"{config.get('Api', 'base_url')}/admin/login",
                 params={"encrypted_bot_id": encrypted_bot_id},
             )
             login_response.raise_for_status()
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logging.error(f"Failed to login as admin to the api: {e}")
-            raise RequestException("Failed to login to api")
+            metrics.api_logins.inc(session="admin", result="failure")
+            raise httpx.HTTPError("Failed to login to api")
 
         csrf_access_token = self.cookies["csrf_access_token"]
         self.headers.update({"X-CSRF-TOKEN": csrf_access_token})
+        self.time_created = time()
 
         logging.info("Admin successfully logged in to the api")
+        metrics.api_logins.inc(session="admin", result="success")
         return True
 
 
-def post_request(user_id, data_json) -> requests.Response:
+async def post_request(user_id, data_json) -> httpx.Response:
     """Post request to the api with the given user id and data
 
     Doesn't handle exceptions, raises them to the caller.
@@ -213,61 +592,60 @@ def post_request(user_id, data_json) -> requests.Response:
         data_json (dict): data to be posted
 
     Returns:
-        requests.Response: Response object of the post request
+        httpx.Response: Response object of the post request
 
     """
-    user_session = session_manager.get_session(user_id)
-
-    logging.info(f"Posting data: {data_json} from user: {user_id}")
-    post_response = user_session.post(
-        f"{config.get('Api', 'base_url')}/birthdays", json=data_json
+    logging.info("Posting data: %s from user: %s", summarize(data_json), user_id)
+    post_response = await _session_request(
+        user_id, "POST", f"{config.get('Api', 'base_url')}/birthdays", json=data_json
     )
+    response_cache.invalidate(user_id)
 
     return post_response
 
 
-def get_request(user_id) -> requests.Response:
+async def get_request(user_id) -> httpx.Response:
     """Get request to the api with the given user id
 
     Doesn't handle exceptions, raises them to the caller.
+    The response is served from `response_cache` if possible.
 
     Args:
         user_id (str): id of the user
 
     Returns:
-        requests.Response: Response object of the get request
+        httpx.Response: Response object of the get request
     """
-    user_session = session_manager.get_session(user_id)
-
-    logging.info(f"Getting data for user: {user_id}")
-    get_response = user_session.get(f"{config.get('Api', 'base_url')}/birthdays")
+    logging.info("Getting data for user: %s", user_id)
+    get_response = await _cached_get_request(
+        user_id, f"{config.get('Api', 'base_url')}/birthdays"
+    )
 
     return get_response
 
 
-def get_by_id_request(user_id, birthday_id) -> requests.Response:
+async def get_by_id_request(user_id, birthday_id) -> httpx.Response:
     """Get request to the api with the given user id and birthday id
 
     Doesn't handle exceptions, raises them to the caller.
+    The response is served from `response_cache` if possible.
 
     Args:
         user_id (str): id of the user
         birthday_id (str): id of the birthday
 
     Returns:
-        requests.Response: Response object of the get request
+        httpx.Response: Response object of the get request
     """
-    user_session = session_manager.get_session(user_id)
-
-    logging.info(f"Getting data for user: {user_id} with birthday_id: {birthday_id}")
-    get_response = user_session.get(
-        f"{config.get('Api', 'base_url')}/birthdays/{birthday_id}"
+    logging.info("Getting data for user: %s with birthday_id: %s", user_id, birthday_id)
+    get_response = await _cached_get_request(
+        user_id, f"{config.get('Api', 'base_url')}/birthdays/{birthday_id}"
     )
 
     return get_response
 
 
-def put_request(user_id, birthday_id, data_json) -> requests.Response:
+async def put_request(user_id, birthday_id, data_json) -> httpx.Response:
     """Put request to the api with the given user id and data
 
     Doesn't handle exceptions, raises them to the caller.
@@ -278,19 +656,21 @@ def put_request(user_id, birthday_id, data_json) -> requests.Response:
         data_json (dict): data to be put
 
     Returns:
-        requests.Response: Response object of the put request
+        httpx.Response: Response object of the put request
     """
-    user_session = session_manager.get_session(user_id)
-
-    logging.info(f"Putting data: {data_json} from user: {user_id}")
-    put_response = user_session.put(
-        f"{config.get('Api', 'base_url')}/birthdays/{birthday_id}", json=data_json
+    logging.info("Putting data: %s from user: %s", summarize(data_json), user_id)
+    put_response = await _session_request(
+        user_id,
+        "PUT",
+        f"{config.get('Api', 'base_url')}/birthdays/{birthday_id}",
+        json=data_json,
     )
+    response_cache.invalidate(user_id)
 
     return put_response
 
 
-def delete_request(user_id, birthday_id) -> requests.Response:
+async def delete_request(user_id, birthday_id) -> httpx.Response:
     """Delete request to the api with the given user id and birthday id
 
     Doesn't handle exceptions, raises them to the caller.
@@ -300,32 +680,46 @@ def delete_request(user_id, birthday_id) -> requests.Response:
         birthday_id (str): id of the birthday
 
     Returns:
-        requests.Response: Response object of the delete request
+        httpx.Response: Response object of the delete request
     """
-    user_session = session_manager.get_session(user_id)
-
-    logging.info(f"Deleting birthday with id: {birthday_id} from user: {user_id}")
-    delete_response = user_session.delete(
-        f"{config.get('Api', 'base_url')}/birthdays/{birthday_id}"
+    logging.info("Deleting birthday with id: %s from user: %s", birthday_id, user_id)
+    delete_response = await _session_request(
+        user_id, "DELETE", f"{config.get('Api', 'base_url')}/birthdays/{birthday_id}"
     )
+    response_cache.invalidate(user_id)
 
     return delete_response
 
 
-def incoming_birthdays_request() -> requests.Response:
-    """Get request to the api as admin to get incoming birthdays
+async def incoming_birthdays_stream():
+    """Get incoming birthdays as admin, yield them as they arrive from the api
+
+    The response is parsed incrementally, so only the birthdays which haven't been
+    consumed yet are kept in memory. Yields nothing if there are no incoming
+    birthdays.
 
     Doesn't handle exceptions, raises them to the caller.
 
-    Returns:
-        requests.Response: Response object of the get request
+    Yields:
+        dict: incoming birthday
     """
-
-    admin_session = session_manager.get_session(BOT_TOKEN)
-
-    logging.info("Getting incoming birthdays")
-    response = admin_session.get(
-        f"{config.get('Api', 'base_url')}/admin/birthdays/incoming"
+    logging.info("Streaming incoming birthdays")
+    response = await _session_request(
+        BOT_TOKEN,
+        "GET",
+        f"{config.get('Api', 'base_url')}/admin/birthdays/incoming",
+        stream=True,
     )
 
-    return response
+    try:
+        if response.status_code == 404:
+            return
+        response.raise_for_status()
+
+        parser = JSONArrayParser()
+        async for chunk in response.aiter_text():
+            for birthday in parser.feed(chunk):
+                yield birthday
+        parser.close()
+    finally:
+        await response.aclose()
@@ -0,0 +1,152 @@
+import logging
+from collections import OrderedDict, defaultdict
+from time import time
+
+
+class ResponseCache:
+    """Class to cache api responses per user
+
+    Responses are stored by user id and url, least recently used first. They
+    expire after `ttl` seconds. When there are more than `max_entries` responses or
+    their bodies take more than `max_bytes`, the least recently used ones are
+    evicted. All responses of a user should be invalidated after the user changes
+    their data.
+
+    Expired responses with an `ETag` or `Last-Modified` header are kept for up to
+    `stale_ttl` seconds, so they can be revalidated with a conditional request
+    instead of being downloaded again.
+
+    Args:
+        ttl (int): Number of seconds a response is served from the cache
+        stale_ttl (int): Number of seconds an expired response is kept for
+          revalidation
+        max_entries (int): Maximum number of responses to keep
+        max_bytes (int): Maximum total size of the response bodies to keep
+
+    Attributes:
+        entries (OrderedDict): (response, time_stored) tuples with (user_id, url)
+          tuples as keys, least recently used first
+        size (int): Total size of the cached response bodies
+        hits (int): Number of requests served from the cache
+        misses (int): Number of requests which had to be sent to the api
+        revalidations (int): Number of expired responses the api confirmed as
+          not modified
+    """
+
+    def __init__(self, ttl, stale_ttl, max_entries, max_bytes):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._keys_by_user = defaultdict(set)
+
+    def get(self, user_id, url):
+        """Return cached response or `None` if it's missing or has expired"""
+        entry = self.entries.get((user_id, url))
+        if entry is None or time() - entry[1] > self.ttl:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end((user_id, url))
+        return entry[0]
+
+    def get_stale(self, user_id, url):
+        """Return cached response even if it has expired, `None` if it's missing"""
+        entry = self.entries.get((user_id, url))
+        return entry[0] if entry is not None else None
+
+    def revalidate(self, user_id, url):
+        """Mark expired response as not modified, return it
+
+        Should be called when the api answers a conditional request with
+        `304 Not Modified`.
+        """
+        response = self.get_stale(user_id, url)
+        if response is not None:
+            self.revalidations += 1
+            self.put(user_id, url, response)
+        return response
+
+    def put(self, user_id, url, response) -> None:
+        """Cache the response, evict the least recently used ones if needed"""
+        self._remove((user_id, url))
+
+        self.entries[(user_id, url)] = (response, time())
+        self.size += len(response.content)
+        self._keys_by_user[user_id].add(url)
+
+        while self.entries and (
+            len(self.entries) > self.max_entries or self.size > self.max_bytes
+        ):
+            self._remove(next(iter(self.entries)))
+
+    def invalidate(self, user_id) -> None:
+        """Remove all responses cached for the user"""
+        for url in list(self._keys_by_user.get(user_id, ())):
+            self._remove((user_id, url))
+
+    def sweep(self) -> None:
+        """Remove expired responses"""
+        now = time()
+        expired_keys = [
+            key
+            for key, (response, time_stored) in self.entries.items()
+            if now - time_stored
+            > (self.stale_ttl if _has_validators(response) else self.ttl)
+        ]
+        for key in expired_keys:
+            self._remove(key)
+
+        logging.info(
+            f"Swept {len(expired_keys)} expired responses. Responses: "
+            f"{len(self.entries)}, size: {self.size} bytes, hit ratio: "
+            f"{self.hit_ratio():.2%}, revalidations: {self.revalidations}"
+        )
+
+    def hit_ratio(self) -> float:
+        """Return share of requests served from the cache"""
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def _remove(self, key) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+
+        self.size -= len(entry[0].content)
+        user_id, url = key
+        self._keys_by_user[user_id].discard(url)
+        if not self._keys_by_user[user_id]:
+            del self._keys_by_user[user_id]
+
+
+def _has_validators(response) -> bool:
+    """Check if the response can be revalidated with a conditional request"""
+    return "ETag" in response.headers or "Last-Modified" in response.headers
+
+
+def conditional_headers(response) -> dict:
+    """Return headers to revalidate the response with a conditional request
+
+    Args:
+        response (httpx.Response): cached response, can be `None`
+
+    Returns:
+        dict: `If-None-Match` and `If-Modified-Since` headers, if the response has
+          the corresponding validators
+    """
+    if response is None:
+        return {}
+
+    headers = {}
+    if "ETag" in response.headers:
+        headers["If-None-Match"] = response.headers["ETag"]
+    if "Last-Modified" in response.headers:
+        headers["If-Modified-Since"] = response.headers["Last-Modified"]
+    return headers
@@ -5,7 +5,7 @@ import os
 fallback_config_path = os.path.join(os.path.dirname(__file__), "..", "config.ini")
 config_file_path = os.getenv("CONFIG_FILE_PATH", fallback_config_path)
 
-config = configparser.ConfigParser()
+config = configparser.ConfigParser(inline_comment_prefixes=("#",))
 
 if not config.read(config_file_path):
     logging.error(f"Configuration file {config_file_path} not found.")
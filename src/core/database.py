@@ -0,0 +1,50 @@
+import logging
+
+import peewee
+from playhouse.migrate import SqliteMigrator, migrate
+
+from src.core.config import config
+
+database_path = config.get("Storage", "database", fallback="birthdaybot.sqlite3")
+
+db = peewee.SqliteDatabase(
+    database_path, pragmas={"journal_mode": "wal", "synchronous": "normal"}
+)
+
+
+class BaseModel(peewee.Model):
+    """Base model for the bot's local database
+
+    The database keeps the bot's own state, birthdays are stored by the api.
+    """
+
+    class Meta:
+        database = db
+
+
+def create_tables(*models) -> None:
+    """Create tables for the given models if they don't exist
+
+    Columns added to a model after its table was created are added to the table,
+    such columns must be nullable or have a default.
+    """
+    with db.connection_context():
+        db.create_tables(models, safe=True)
+        _add_missing_columns(models)
+    logging.info(f"Database tables are ready in {database_path}")
+
+
+def _add_missing_columns(models) -> None:
+    migrator = SqliteMigrator(db)
+    operations = []
+
+    for model in models:
+        table = model._meta.table_name
+        columns = {column.name for column in db.get_columns(table)}
+        for field in model._meta.sorted_fields:
+            if field.column_name not in columns:
+                logging.info(f"Adding column {field.column_name} to {table}")
+                operations.append(migrator.add_column(table, field.column_name, field))
+
+    if operations:
+        migrate(*operations)
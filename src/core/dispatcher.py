@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import random
+from time import monotonic
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+# results of `MessageDispatcher.send()`
+SENT = "sent"
+FAILED = "failed"
+BLOCKED = "blocked"
+GAVE_UP = "gave_up"
+
+
+class TokenBucket:
+    """Token bucket rate limiter
+
+    Allows bursts of up to `capacity` acquisitions, refills `rate` tokens per second.
+
+    Args:
+        rate (float): Number of tokens added per second
+        capacity (float): Maximum number of tokens in the bucket
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = monotonic()
+        self.resume_at = 0
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        while True:
+            now = monotonic()
+            if now < self.resume_at:
+                await asyncio.sleep(self.resume_at - now)
+                continue
+
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds) -> None:
+        """Don't give out tokens for the next `seconds` seconds"""
+        self.resume_at = max(self.resume_at, monotonic() + seconds)
+        self.tokens = 0
+
+
+class DispatchSummary:
+    """Summary of a dispatcher run
+
+    Attributes:
+        sent (int): Number of messages sent
+        failed (int): Number of messages which failed to be sent
+        blocked (int): Number of messages not sent because the user blocked the bot
+        suppressed (int): Number of messages skipped because the chat is suppressed
+        retries (int): Number of times sending was retried after a flood or
+          network error
+        duration (float): Duration of the run in seconds
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.suppressed = 0
+        self.retries = 0
+        self.duration = 0.0
+
+    def __str__(self):
+        return (
+            f"sent: {self.sent}, failed: {self.failed}, blocked: {self.blocked}, "
+            f"suppressed: {self.suppressed}, retries: {self.retries}, duration: {self.duration:.2f}s"
+        )
+
+
+class MessageDispatcher:
+    """Class to send many messages concurrently within Telegram's rate limits
+
+    Messages are sent by `max_concurrency` workers. Every message takes a token from
+    the global bucket and from the bucket of its chat. When Telegram answers with
+    `RetryAfter`, all workers pause for the requested time and the message is sent
+    again. Transient network errors are retried after an exponential backoff with
+    full jitter, so failed messages aren't retried all at once. Chats which answer
+    with `Forbidden` are reported to `on_blocked` and aren't retried. Messages
+    which can never be sent, e.g. because of `BadRequest`, aren't retried either.
+
+    Args:
+        bot (telegram.Bot): Bot to send messages with
+        max_concurrency (int): Maximum number of messages being sent at once
+        rate (float): Maximum number of messages per second
+        chat_rate (float): Maximum number of messages per second to a single chat
+        max_retries (int): Maximum number of retries of a message after `RetryAfter`
+          or a network error
+        backoff (float): Base delay in seconds before retrying after a network error
+        max_backoff (float): Maximum delay in seconds before retrying
+        is_suppressed (callable): Called with a chat id, messages to the chat are
+          skipped if it returns True
+        on_blocked (callable): Called with a chat id which answered with `Forbidden`
+    """
+
+    def __init__(
+        self,
+        bot,
+        max_concurrency,
+        rate,
+        chat_rate,
+        max_retries=3,
+        backoff=1.0,
+        max_backoff=30.0,
+        is_suppressed=None,
+        on_blocked=None,
+    ):
+        self.bot = bot
+        self.max_concurrency = max_concurrency
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.is_suppressed = is_suppressed
+        self.on_blocked = on_blocked
+        self.bucket = TokenBucket(rate=rate, capacity=1)
+        self.chat_buckets = {}
+        self.summary = DispatchSummary()
+
+    async def run(self, messages, **kwargs) -> DispatchSummary:
+        """Send all messages and return the summary of the run.
+
+        Args:
+            messages: iterable or async iterable of (chat_id, text) tuples. A tuple
+              can have an additional `on_sent` callback, which is called once the
+              message has been sent, and an `on_failed` callback, which is called
+              if the message failed and sending it again won't help. Errors of
+              the callbacks are logged, they don't stop the run
+            **kwargs: additional arguments for `telegram.Bot.send_message`
+
+        Returns:
+            DispatchSummary: Summary of the run
+        """
+        start = monotonic()
+        queue = asyncio.Queue(maxsize=self.max_concurrency * 2)
+        workers = [
+            asyncio.create_task(self._worker(queue, kwargs))
+            for _ in range(self.max_concurrency)
+        ]
+        producer = asyncio.create_task(self._produce(queue, messages, len(workers)))
+        tasks = [producer, *workers]
+
+        try:
+            # a worker which died would leave the producer waiting on a full queue
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.summary.duration = monotonic() - start
+        return self.summary
+
+    async def _produce(self, queue, messages, workers) -> None:
+        if hasattr(messages, "__aiter__"):
+            async for message in messages:
+                await queue.put(message)
+        else:
+            for message in messages:
+                await queue.put(message)
+
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def _worker(self, queue, kwargs) -> None:
+        while True:
+            message = await queue.get()
+            if message is None:
+                return
+
+            chat_id, text, *callbacks = message
+            on_sent, on_failed = (*callbacks, None, None)[:2]
+            if self.is_suppressed and self.is_suppressed(chat_id):
+                self.summary.suppressed += 1
+                continue
+
+            result = await self.send(chat_id, text, **kwargs)
+            if result == SENT and on_sent:
+                _call(on_sent, chat_id)
+            elif result == FAILED and on_failed:
+                _call(on_failed, chat_id)
+
+    async def send(self, chat_id, text, **kwargs) -> str:
+        """Send a message within the rate limits, record the result in the summary.
+
+        Returns:
+            str: `SENT`, `FAILED` if sending the message again won't help,
+              `BLOCKED` if the user blocked the bot, `GAVE_UP` if the retries of
+              a flood or network error were exhausted
+        """
+        chat_bucket = self.chat_buckets.get(chat_id)
+        if chat_bucket is None:
+            chat_bucket = self.chat_buckets[chat_id] = TokenBucket(
+                rate=self.chat_rate, capacity=1
+            )
+
+        await chat_bucket.acquire()
+
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                self.summary.sent += 1
+                logging.debug("Sent message to user %s", chat_id)
+                return SENT
+            except RetryAfter as e:
+                logging.warning(
+                    "Flood limit exceeded while sending to %s, retrying in %s seconds",
+                    chat_id,
+                    e.retry_after,
+                )
+                self.bucket.pause(e.retry_after)
+                if attempt < self.max_retries:
+                    self.summary.retries += 1
+                last_error = "flood limit"
+            except Forbidden as e:
+                logging.warning(
+                    "Failed to send message to user %s: %s. "
+                    "User might have blocked the bot or left the chat.",
+                    chat_id,
+                    e,
+                )
+                self.summary.blocked += 1
+                if self.on_blocked:
+                    _call(self.on_blocked, chat_id, chat_id)
+                return BLOCKED
+            except BadRequest as e:
+                logging.error("Failed to send message to user %s: %s", chat_id, e)
+                self.summary.failed += 1
+                return FAILED
+            except NetworkError as e:
+                # also covers TimedOut
+                if attempt < self.max_retries:
+                    delay = self.backoff_delay(attempt)
+                    logging.warning(
+                        "Network error while sending to %s: %s, retrying in %.2f seconds",
+                        chat_id,
+                        e,
+                        delay,
+                    )
+                    self.summary.retries += 1
+                    await asyncio.sleep(delay)
+                last_error = e
+            except Exception as e:
+                logging.error("Failed to send message to user %s: %s", chat_id, e)
+                self.summary.failed += 1
+                return FAILED
+
+        logging.error("Failed to send message to user %s: %s", chat_id, last_error)
+        self.summary.failed += 1
+        return GAVE_UP
+
+    def backoff_delay(self, attempt) -> float:
+        """Return a random delay before the retry number `attempt`, starting from 0"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+
+def _call(callback, chat_id, *args) -> None:
+    """Call a callback of a message, log its errors instead of raising them
+
+    Callbacks usually record the result in the database, a failed write must not
+    stop the worker sending the other messages.
+    """
+    try:
+        callback(*args)
+    except Exception as e:
+        logging.error(
+            "Failed to record the result of the message to %s: %s", chat_id, e
+        )
@@ -0,0 +1,32 @@
+import peewee
+import pytz
+
+from src.core.database import BaseModel, create_tables
+
+
+class JobRun(BaseModel):
+    """Last completed run of a scheduled job
+
+    Attributes:
+        name (str): Name of the job
+        completed_at (datetime): Scheduled time of the last completed run, in UTC
+    """
+
+    name = peewee.CharField(primary_key=True)
+    completed_at = peewee.DateTimeField()
+
+
+create_tables(JobRun)
+
+
+def get_last_run(name):
+    """Return aware scheduled time of the last completed run, `None` if it never ran"""
+    job_run = JobRun.get_or_none(JobRun.name == name)
+    return pytz.utc.localize(job_run.completed_at) if job_run else None
+
+
+def save_run(name, completed_at) -> None:
+    """Record a completed run of the job, `completed_at` is an aware datetime"""
+    JobRun.replace(
+        name=name, completed_at=completed_at.astimezone(pytz.utc).replace(tzinfo=None)
+    ).execute()
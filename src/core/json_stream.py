@@ -0,0 +1,95 @@
+import json
+
+# longest item which is buffered while waiting for its end, in characters
+MAX_ITEM_SIZE = 1024 * 1024
+
+
+class JSONArrayParser:
+    """Incremental parser of a JSON array of objects
+
+    Feed the array in chunks of any size, get back the objects which have been
+    parsed completely so far. Only the unparsed tail of the array is kept in memory.
+    Items of the array have to be objects or arrays, so that an incomplete item
+    can't be mistaken for a complete one.
+
+    A malformed item can't be told from an incomplete one, so an item is buffered
+    up to `max_item_size` characters only.
+
+    Args:
+        max_item_size (int): Maximum length of an item in characters
+    """
+
+    def __init__(self, max_item_size=MAX_ITEM_SIZE):
+        self.max_item_size = max_item_size
+        self.buffer = ""
+        self.started = False
+        self.finished = False
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, chunk) -> list:
+        """Parse next chunk of the array.
+
+        Args:
+            chunk (str): next part of the JSON document
+
+        Raises:
+            ValueError: Raised if the document is not a JSON array or an item is
+              longer than `max_item_size`
+
+        Returns:
+            list: items completed by this chunk
+        """
+        buffer = self.buffer + chunk
+        items = []
+        position = 0
+
+        while not self.finished:
+            position = _skip_whitespace(buffer, position)
+            if position == len(buffer):
+                break
+
+            if not self.started:
+                if buffer[position] != "[":
+                    raise ValueError("Expected a JSON array")
+                self.started = True
+                position += 1
+                continue
+
+            if buffer[position] == "]":
+                self.finished = True
+                position += 1
+                break
+
+            if buffer[position] == ",":
+                position += 1
+                continue
+
+            try:
+                item, position = self._decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if len(buffer) - position > self.max_item_size:
+                    raise ValueError(
+                        f"Malformed JSON array item or item longer than "
+                        f"{self.max_item_size} characters"
+                    )
+                # the item is not complete yet, wait for the next chunk
+                break
+            items.append(item)
+
+        self.buffer = buffer[position:]
+        return items
+
+    def close(self) -> None:
+        """Check that the whole array has been parsed.
+
+        Raises:
+            ValueError: Raised if the array is incomplete
+        """
+        if not self.finished or self.buffer.strip():
+            raise ValueError("Incomplete JSON array")
+
+
+def _skip_whitespace(text, position) -> int:
+    while position < len(text) and text[position] in " \t\n\r":
+        position += 1
+    return position
@@ -0,0 +1,41 @@
+from src.core.config import config
+
+MAX_FIELD_LENGTH = config.getint("Logs", "max_field_length", fallback=200)
+
+
+def truncate(value, limit=None) -> str:
+    """Return the value as a string cut to `limit` characters
+
+    Args:
+        value: value to log
+        limit (int): maximum length, `[Logs] max_field_length` by default
+    """
+    limit = limit or MAX_FIELD_LENGTH
+    text = str(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text)} chars)"
+
+
+def summarize(payload) -> str:
+    """Describe a payload without logging its values
+
+    Users' birthdays are personal data, so only the shape of a payload is logged,
+    e.g. `{id: int, name: str(5), note: None}`.
+    """
+    if isinstance(payload, dict):
+        fields = ", ".join(
+            f"{key}: {_describe(value)}" for key, value in payload.items()
+        )
+        return truncate(f"{{{fields}}}")
+    if isinstance(payload, list):
+        return f"list({len(payload)})"
+    return _describe(payload)
+
+
+def _describe(value) -> str:
+    if value is None:
+        return "None"
+    if isinstance(value, (str, list, dict)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
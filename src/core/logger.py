@@ -1,8 +1,12 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+from time import monotonic
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 from src.core.config import config
+from src.core.tracing import CorrelationIdFilter
 
 log_dir = config.get("Logs", "log_to")
 if not os.path.exists(log_dir):
@@ -14,35 +18,125 @@ class ExcludeGetUpdatesFilter(logging.Filter):
         return "getUpdates" not in record.getMessage()
 
 
-logging.basicConfig(
-    level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
+class SamplingFilter(logging.Filter):
+    """Filter which limits repetitive log records
+
+    Records are repetitive if they come from the same logger with the same
+    unformatted message, so only lazily formatted messages with arguments are
+    sampled. Up to
+    `burst` such records are let through every `interval` seconds, the first record
+    of the next interval tells how many were dropped. Records above `max_level`
+    are never dropped.
+
+    Args:
+        interval (float): Length of a sampling interval in seconds
+        burst (int): Number of repetitive records let through in an interval
+        max_level (int): Highest level of the sampled records
+    """
+
+    def __init__(self, interval, burst, max_level=logging.INFO):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.max_level = max_level
+        self.windows = {}
+
+    def filter(self, record):
+        if record.levelno > self.max_level or not record.args:
+            return True
+
+        key = (record.name, record.levelno, record.msg)
+        now = monotonic()
+        window = self.windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            dropped = window[2] if window else 0
+            self.windows[key] = [now, 1, 0]
+            if dropped:
+                record.msg = f"{record.msg} ({dropped} similar messages dropped)"
+            return True
+
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+
+        window[2] += 1
+        return False
+
+
+def parse_levels(levels) -> dict:
+    """Parse per-module log levels
+
+    Args:
+        levels (str): comma separated `module:LEVEL` pairs, e.g. "httpx:WARNING"
+
+    Returns:
+        dict: level names by logger name
+    """
+    parsed = {}
+    for item in levels.split(","):
+        if item.strip():
+            name, level = item.split(":")
+            parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+formatter = logging.Formatter(
+    "%(asctime)s - %(levelname)s - [%(correlation_id)s] - %(message)s"
 )
 
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(formatter)
+
 info_handler = RotatingFileHandler(
     os.path.join(log_dir, "info.log"), maxBytes=5 * 1024 * 1024, backupCount=3
 )
 info_handler.setLevel(logging.INFO)
-info_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-)
+info_handler.setFormatter(formatter)
 info_handler.addFilter(ExcludeGetUpdatesFilter())
 
 warning_handler = RotatingFileHandler(
     os.path.join(log_dir, "warning.log"), maxBytes=5 * 1024 * 1024, backupCount=3
 )
 warning_handler.setLevel(logging.WARNING)
-warning_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-)
+warning_handler.setFormatter(formatter)
 
 error_handler = RotatingFileHandler(
     os.path.join(log_dir, "error.log"), maxBytes=5 * 1024 * 1024, backupCount=3
 )
 error_handler.setLevel(logging.ERROR)
-error_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+error_handler.setFormatter(formatter)
+
+# Records are put to the queue on the event loop thread. `QueueHandler.prepare()`
+# interpolates the message's %-arguments there too, so only records which pass
+# the level check and the filters pay for it. Applying the formatter, writing and
+# rotating the files happen on the listener's background thread
+log_queue = queue.SimpleQueue()
+listener = QueueListener(
+    log_queue,
+    console_handler,
+    info_handler,
+    warning_handler,
+    error_handler,
+    respect_handler_level=True,
 )
 
-logging.getLogger().addHandler(info_handler)
-logging.getLogger().addHandler(warning_handler)
-logging.getLogger().addHandler(error_handler)
+root_logger = logging.getLogger()
+# drop the handler added by logging calls made before this module was imported
+for handler in root_logger.handlers[:]:
+    root_logger.removeHandler(handler)
+root_logger.setLevel(config.get("Logs", "level", fallback="DEBUG").upper())
+queue_handler = QueueHandler(log_queue)
+queue_handler.addFilter(CorrelationIdFilter())
+queue_handler.addFilter(
+    SamplingFilter(
+        interval=config.getfloat("Logs", "sample_interval", fallback=60),
+        burst=config.getint("Logs", "sample_burst", fallback=20),
+    )
+)
+root_logger.addHandler(queue_handler)
+
+for name, level in parse_levels(config.get("Logs", "levels", fallback="")).items():
+    logging.getLogger(name).setLevel(level)
+
+listener.start()
+atexit.register(listener.stop)
@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import re
+from bisect import bisect_left
+
+from src.core.config import config
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RUN_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+class Metric:
+    """Base class of metrics in the Prometheus text format
+
+    Args:
+        name (str): Name of the metric
+        documentation (str): Help text of the metric
+        labels (tuple): Names of the labels
+    """
+
+    type = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+
+    def _key(self, labels) -> tuple:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format_labels(self, key, extra=None) -> str:
+        pairs = list(zip(self.labels, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return (
+            "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+        )
+
+    def samples(self):
+        """Yield lines of the metric's samples"""
+        for key, value in self.values.items():
+            yield f"{self.name}{self._format_labels(key)} {_format_value(value)}"
+
+    def render(self) -> str:
+        """Return the metric in the Prometheus text format"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Counter which only goes up"""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Gauge whose value is read from a callback when the metrics are collected
+
+    Args:
+        callback (callable): Returns the current value of the gauge
+        kind (str): Type of the metric, "counter" for values which only go up
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, callback, kind="gauge"):
+        super().__init__(name, documentation)
+        self.callback = callback
+        self.type = kind
+
+    def samples(self):
+        yield f"{self.name} {_format_value(self.callback())}"
+
+
+class Histogram(Metric):
+    """Histogram of observed values, e.g. durations in seconds
+
+    Args:
+        buckets (tuple): Sorted upper bounds of the buckets, `+Inf` is added
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels) -> None:
+        key = self._key(labels)
+        series = self.values.get(key)
+        if series is None:
+            # counts of each bucket and +Inf, sum
+            series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                labels = self._format_labels(key, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{self._format_labels(key)} {_format_value(total)}"
+            yield f"{self.name}_count{self._format_labels(key)} {cumulative}"
+
+
+class Registry:
+    """Collection of metrics rendered together
+
+    Attributes:
+        metrics (list): Registered metrics
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text format"""
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_value(value) -> str:
+    if isinstance(value, str):
+        return value
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def endpoint(url) -> str:
+    """Return the path of the url with ids replaced, to keep the number of labels low"""
+    path = re.sub(r"^[a-z]+://[^/]+", "", str(url)).split("?")[0]
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path) or "/"
+
+
+registry = Registry()
+
+api_request_duration = registry.register(
+    Histogram(
+        "birthdaybot_api_request_duration_seconds",
+        "Time until the response headers of the api were received",
+        labels=("method", "endpoint"),
+    )
+)
+api_requests = registry.register(
+    Counter(
+        "birthdaybot_api_requests_total",
+        "Requests to the api by status code, 'error' if no response was received",
+        labels=("method", "endpoint", "status"),
+    )
+)
+api_logins = registry.register(
+    Counter(
+        "birthdaybot_api_logins_total",
+        "Logins to the api",
+        labels=("session", "result"),
+    )
+)
+update_duration = registry.register(
+    Histogram(
+        "birthdaybot_update_duration_seconds",
+        "Time spent handling an update, by command or kind of the update",
+        labels=("handler",),
+    )
+)
+reminder_run_duration = registry.register(
+    Histogram(
+        "birthdaybot_reminder_run_duration_seconds",
+        "Duration of reminder runs",
+        labels=("job",),
+        buckets=RUN_BUCKETS,
+    )
+)
+reminder_messages = registry.register(
+    Counter(
+        "birthdaybot_reminder_messages_total",
+        "Reminder messages by result",
+        labels=("result",),
+    )
+)
+
+
+class MetricsServer:
+    """Minimal HTTP server exposing the registry on `GET /metrics`
+
+    Args:
+        registry (Registry): Metrics to expose
+        host (str): Address to listen on
+        port (int): Port to listen on
+    """
+
+    def __init__(self, registry, host, port):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        logging.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _handle(self, reader, writer) -> None:
+        try:
+            request_line = await reader.readline()
+            # the headers are not needed
+            while (await reader.readline()).strip():
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+                status = "200 OK"
+                body = self.registry.render().encode()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status = "404 Not Found"
+                body = b"Not found\n"
+                content_type = "text/plain; charset=utf-8"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+metrics_server = (
+    MetricsServer(
+        registry,
+        host=config.get("Metrics", "listen", fallback="127.0.0.1"),
+        port=config.getint("Metrics", "port", fallback=9464),
+    )
+    if config.getboolean("Metrics", "enabled", fallback=False)
+    else None
+)
@@ -0,0 +1,229 @@
+import json
+import logging
+from datetime import datetime, timedelta
+
+import peewee
+import pytz
+
+from src.core.database import BaseModel, create_tables, db
+
+ENQUEUE_BATCH_SIZE = 500
+DRAIN_BATCH_SIZE = 100
+KEEP_DAYS = 7
+
+
+class OutboxEntry(BaseModel):
+    """Reminder about a birthday which is due to be sent
+
+    An entry is unique for a birthday, date of the run and number of days until
+    the birthday, so enqueuing the same reminder twice has no effect.
+
+    Attributes:
+        birthday_id (int): id of the birthday
+        date (date): Date of the run
+        offset (int): Number of days until the birthday
+        chat_id (int): Telegram id of the user to remind
+        birthday (str): JSON of the birthday as returned by the API
+        text (str): Rendered reminder, `None` for entries enqueued before rendering
+          moved to the enqueue time and for changed birthdays, see
+          `update_birthday()`
+        due_at (datetime): UTC time when the reminder is due, `None` if it's due
+          right away
+        sent_at (datetime): Time when the reminder was sent, `None` if it wasn't
+        failed_at (datetime): Time when sending failed for good, e.g. the chat
+          wasn't found, such reminders aren't sent again
+    """
+
+    birthday_id = peewee.BigIntegerField()
+    date = peewee.DateField()
+    offset = peewee.SmallIntegerField()
+    chat_id = peewee.BigIntegerField()
+    birthday = peewee.TextField()
+    text = peewee.TextField(null=True)
+    due_at = peewee.DateTimeField(null=True)
+    sent_at = peewee.DateTimeField(null=True)
+    failed_at = peewee.DateTimeField(null=True)
+
+    class Meta:
+        indexes = (
+            (("birthday_id", "date", "offset"), True),
+            (("date", "sent_at", "chat_id"), False),
+        )
+
+
+create_tables(OutboxEntry)
+
+
+async def enqueue(birthdays, date, render, due_at=None, on_insert=None) -> int:
+    """Add reminders about the birthdays to the outbox, skip already enqueued ones.
+
+    Args:
+        birthdays: async iterable of incoming birthdays from the API
+        date (date): Date of the run
+        render (callable): Returns the text of the reminder about a birthday
+        due_at (callable): Returns an aware datetime when the reminder to a user is
+          due, called with the user's Telegram id. Reminders are due right away
+          if `None`
+        on_insert (callable): Called with the Telegram ids of the users of each
+          batch once it is stored
+
+    Returns:
+        int: Number of birthdays consumed
+    """
+    count = 0
+    batch = []
+
+    async for birthday in birthdays:
+        chat_id = birthday["creator"]["telegram_id"]
+        batch.append(
+            {
+                "birthday_id": birthday["id"],
+                "date": date,
+                "offset": birthday["incoming_in_days"],
+                "chat_id": chat_id,
+                "birthday": json.dumps(birthday),
+                "text": render(birthday),
+                "due_at": _to_utc(due_at(chat_id)) if due_at else None,
+            }
+        )
+        if len(batch) >= ENQUEUE_BATCH_SIZE:
+            count += _insert(batch, on_insert)
+            batch = []
+
+    count += _insert(batch, on_insert)
+    logging.debug("Enqueued reminders about %s birthdays for %s", count, date)
+    return count
+
+
+def _insert(batch, on_insert=None) -> int:
+    if batch:
+        with db.atomic():
+            OutboxEntry.insert_many(batch).on_conflict_ignore().execute()
+        if on_insert:
+            on_insert([row["chat_id"] for row in batch])
+    return len(batch)
+
+
+def _to_utc(time):
+    return time.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def pending(date, due_before=None, offsets=None, chat_ids=None):
+    """Yield unsent reminders of the date grouped by user, skip failed ones.
+
+    Users are read in batches, so the outbox is never loaded into memory at once.
+
+    Args:
+        date (date): Date of the run
+        due_before (datetime): Aware datetime, only reminders due by then are
+          yielded. All reminders if `None`
+        offsets (tuple): Numbers of days until the birthday to yield reminders
+          about, all if `None`
+        chat_ids (list): Telegram ids of the users to yield reminders to, all
+          users if `None`
+
+    Yields:
+        tuple: (chat_id, entries) with the user's unsent `OutboxEntry` objects
+    """
+    condition = (
+        (OutboxEntry.date == date)
+        & OutboxEntry.sent_at.is_null()
+        & OutboxEntry.failed_at.is_null()
+    )
+    if due_before is not None:
+        condition &= OutboxEntry.due_at.is_null() | (
+            OutboxEntry.due_at <= _to_utc(due_before)
+        )
+    if offsets is not None:
+        condition &= OutboxEntry.offset.in_(offsets)
+    if chat_ids is not None:
+        condition &= OutboxEntry.chat_id.in_(chat_ids)
+
+    last_chat_id = None
+
+    while True:
+        query = OutboxEntry.select(OutboxEntry.chat_id).where(condition)
+        if last_chat_id is not None:
+            query = query.where(OutboxEntry.chat_id > last_chat_id)
+        chat_ids = [
+            entry.chat_id
+            for entry in query.distinct()
+            .order_by(OutboxEntry.chat_id)
+            .limit(DRAIN_BATCH_SIZE)
+        ]
+        if not chat_ids:
+            return
+
+        entries = {chat_id: [] for chat_id in chat_ids}
+        for entry in OutboxEntry.select().where(
+            condition & OutboxEntry.chat_id.in_(chat_ids)
+        ):
+            entries[entry.chat_id].append(entry)
+
+        for chat_id in chat_ids:
+            yield chat_id, entries[chat_id]
+        last_chat_id = chat_ids[-1]
+
+
+def mark_sent(entries) -> None:
+    """Mark all entries as sent at once"""
+    OutboxEntry.update(sent_at=datetime.now()).where(
+        OutboxEntry.id.in_([entry.id for entry in entries])
+    ).execute()
+
+
+def mark_failed(entries) -> None:
+    """Mark all entries as failed for good at once, they aren't sent again"""
+    OutboxEntry.update(failed_at=datetime.now()).where(
+        OutboxEntry.id.in_([entry.id for entry in entries])
+    ).execute()
+
+
+def _unsent(birthday_id):
+    return (
+        (OutboxEntry.birthday_id == int(birthday_id))
+        & OutboxEntry.sent_at.is_null()
+        & OutboxEntry.failed_at.is_null()
+    )
+
+
+def update_birthday(birthday_id, data) -> int:
+    """Update unsent reminders about a birthday the user has changed.
+
+    Reminders are rendered again when they are sent. Reminders about a birthday
+    moved to another day are deleted, they aren't incoming anymore.
+
+    Args:
+        birthday_id (int): id of the birthday
+        data (dict): New fields of the birthday, as put to the API
+
+    Returns:
+        int: Number of updated reminders
+    """
+    updated = 0
+    with db.atomic():
+        for entry in OutboxEntry.select().where(_unsent(birthday_id)):
+            old = json.loads(entry.birthday)
+            birthday = {**old, **data}
+            if (birthday["day"], birthday["month"]) != (old["day"], old["month"]):
+                entry.delete_instance()
+                continue
+            entry.birthday = json.dumps(birthday)
+            entry.text = None
+            entry.save()
+            updated += 1
+    return updated
+
+
+def discard(birthday_id) -> int:
+    """Delete unsent reminders about a deleted birthday, return their number"""
+    return OutboxEntry.delete().where(_unsent(birthday_id)).execute()
+
+
+def delete_old(date) -> int:
+    """Delete entries older than `KEEP_DAYS` days before the date, return their number"""
+    return (
+        OutboxEntry.delete()
+        .where(OutboxEntry.date < date - timedelta(days=KEEP_DAYS))
+        .execute()
+    )
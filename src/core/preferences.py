@@ -0,0 +1,137 @@
+import logging
+from datetime import datetime, time, timedelta
+
+import peewee
+import pytz
+
+from src.core.database import BaseModel, create_tables
+
+DEFAULT_TIMEZONE = "Europe/Kyiv"
+DEFAULT_REMINDER_HOUR = 10
+
+
+class UserPreferences(BaseModel):
+    """Reminder preferences of a user
+
+    Only users who changed the defaults have a row.
+
+    Attributes:
+        telegram_id (int): Telegram id of the user
+        timezone (str): Name of the user's timezone, e.g. "Europe/Kyiv"
+        reminder_hour (int): Hour in the user's timezone to send reminders at
+    """
+
+    telegram_id = peewee.BigIntegerField(primary_key=True)
+    timezone = peewee.CharField(default=DEFAULT_TIMEZONE, index=True)
+    reminder_hour = peewee.SmallIntegerField(default=DEFAULT_REMINDER_HOUR)
+
+
+create_tables(UserPreferences)
+
+
+def get_preferences(telegram_id) -> UserPreferences:
+    """Return preferences of the user, defaults if they haven't been changed"""
+    return UserPreferences.get_or_none(
+        UserPreferences.telegram_id == telegram_id
+    ) or UserPreferences(telegram_id=telegram_id)
+
+
+def save_preferences(telegram_id, **preferences) -> None:
+    """Save the given preferences of the user, keep the other ones"""
+    user_preferences = get_preferences(telegram_id)
+    for name, value in preferences.items():
+        setattr(user_preferences, name, value)
+
+    UserPreferences.replace(
+        telegram_id=telegram_id,
+        timezone=user_preferences.timezone,
+        reminder_hour=user_preferences.reminder_hour,
+    ).execute()
+
+
+class ReminderShard:
+    """Users who should get their reminders during the current hour
+
+    A user belongs to the shard if it's their reminder hour in their timezone.
+    Users without preferences belong to the shard at `DEFAULT_REMINDER_HOUR` in
+    `DEFAULT_TIMEZONE`.
+
+    Args:
+        now (datetime): Aware datetime of the run, defaults to the current time
+
+    Attributes:
+        members (set): Telegram ids of users with preferences who are in the shard
+        customized (set): Telegram ids of all users with preferences
+        includes_defaults (bool): True if users without preferences are in the shard
+    """
+
+    def __init__(self, now=None):
+        now = now or datetime.now(pytz.utc)
+
+        self.members = set()
+        self.customized = set()
+        self.includes_defaults = (
+            now.astimezone(pytz.timezone(DEFAULT_TIMEZONE)).hour
+            == DEFAULT_REMINDER_HOUR
+        )
+
+        local_hours = {}
+        for user in UserPreferences.select().iterator():
+            if user.timezone not in local_hours:
+                local_hours[user.timezone] = now.astimezone(
+                    pytz.timezone(user.timezone)
+                ).hour
+
+            self.customized.add(user.telegram_id)
+            if user.reminder_hour == local_hours[user.timezone]:
+                self.members.add(user.telegram_id)
+
+        logging.info(
+            f"Reminder shard for {now:%H:%M} UTC: {len(self.members)} users with "
+            f"preferences, users without preferences: {self.includes_defaults}"
+        )
+
+    def is_empty(self) -> bool:
+        """Check if nobody should get reminders during this hour"""
+        return not self.members and not self.includes_defaults
+
+    def __contains__(self, telegram_id) -> bool:
+        if telegram_id in self.members:
+            return True
+        return self.includes_defaults and telegram_id not in self.customized
+
+
+class ReminderSchedule:
+    """Times when users get reminders during a day
+
+    Used to prepare reminders in advance, a reminder is due at the start of the
+    UTC hour whose shard the user belongs to, see `ReminderShard`.
+
+    Args:
+        date (date): UTC date of the day
+
+    Attributes:
+        date (date): UTC date of the day
+        times (dict): Aware reminder times of users with preferences by Telegram id
+        default_time (datetime): Aware reminder time of users without preferences
+    """
+
+    def __init__(self, date):
+        self.date = date
+        self.default_time = self._reminder_time(DEFAULT_TIMEZONE, DEFAULT_REMINDER_HOUR)
+        self.times = {
+            user.telegram_id: self._reminder_time(user.timezone, user.reminder_hour)
+            for user in UserPreferences.select().iterator()
+        }
+
+    def _reminder_time(self, timezone, hour) -> datetime:
+        local_time = pytz.timezone(timezone).localize(
+            datetime.combine(self.date, time(hour=hour))
+        )
+        utc_time = local_time.astimezone(pytz.utc)
+        # move to the UTC date, the hour is the same as of the user's shard that day
+        return utc_time + timedelta(days=(self.date - utc_time.date()).days)
+
+    def due_at(self, telegram_id) -> datetime:
+        """Return the aware UTC time when the user gets reminders"""
+        return self.times.get(telegram_id, self.default_time)
@@ -0,0 +1,92 @@
+import json
+import logging
+from time import time
+
+import peewee
+
+from src.core.database import BaseModel, create_tables
+
+
+class StoredSession(BaseModel):
+    """Snapshot of an api session
+
+    Attributes:
+        id (str): id of the session, "admin" for the admin session
+        cookies (str): JSON list of the session's cookies
+        time_created (float): Time when the session was logged in
+    """
+
+    id = peewee.CharField(primary_key=True)
+    cookies = peewee.TextField()
+    time_created = peewee.FloatField(index=True)
+
+
+class SessionStore:
+    """Class to persist api sessions across restarts
+
+    Keeps the cookie jar and `time_created` of every logged in session, so the
+    sessions can be restored instead of logging in again after a restart.
+
+    Args:
+        expires_seconds (int): Number of seconds after which a session expires
+    """
+
+    def __init__(self, expires_seconds):
+        self.expires_seconds = expires_seconds
+        create_tables(StoredSession)
+
+    def save(self, id, cookies, time_created) -> None:
+        """Save session's cookies, replacing the previous snapshot.
+
+        Args:
+            id (str): id of the session
+            cookies (httpx.Cookies): cookies of the session
+            time_created (float): Time when the session was logged in
+        """
+        cookies_json = json.dumps(
+            [
+                {
+                    "name": cookie.name,
+                    "value": cookie.value,
+                    "domain": cookie.domain,
+                    "path": cookie.path,
+                }
+                for cookie in cookies.jar
+            ]
+        )
+        StoredSession.replace(
+            id=id, cookies=cookies_json, time_created=time_created
+        ).execute()
+
+    def load(self, limit) -> list:
+        """Load the most recent sessions which haven't expired yet.
+
+        Args:
+            limit (int): Maximum number of sessions to load
+
+        Returns:
+            list: (id, cookies, time_created) tuples, least recent first. `cookies`
+              is a list of dicts with `name`, `value`, `domain` and `path` keys
+        """
+        stored_sessions = (
+            StoredSession.select()
+            .where(StoredSession.time_created > time() - self.expires_seconds)
+            .order_by(StoredSession.time_created.desc())
+            .limit(limit)
+        )
+        sessions = [
+            (stored.id, json.loads(stored.cookies), stored.time_created)
+            for stored in stored_sessions
+        ]
+        sessions.reverse()
+
+        logging.info(f"Loaded {len(sessions)} stored sessions")
+        return sessions
+
+    def delete_expired(self) -> int:
+        """Delete snapshots of expired sessions, return their number"""
+        return (
+            StoredSession.delete()
+            .where(StoredSession.time_created <= time() - self.expires_seconds)
+            .execute()
+        )
@@ -0,0 +1,49 @@
+import logging
+from datetime import datetime
+
+import peewee
+
+from src.core.database import BaseModel, create_tables
+
+
+class BlockedChat(BaseModel):
+    """Chat which answered with `Forbidden`, reminders aren't sent to it
+
+    Attributes:
+        telegram_id (int): Telegram id of the user
+        blocked_at (datetime): Time when sending to the chat was forbidden
+    """
+
+    telegram_id = peewee.BigIntegerField(primary_key=True)
+    blocked_at = peewee.DateTimeField(default=datetime.now)
+
+
+create_tables(BlockedChat)
+
+# Kept in memory so that checking a chat doesn't query the database on every update
+_blocked = {chat.telegram_id for chat in BlockedChat.select(BlockedChat.telegram_id)}
+
+
+def is_blocked(telegram_id) -> bool:
+    """Check if sending to the chat is suppressed"""
+    return telegram_id in _blocked
+
+
+def block(telegram_id) -> None:
+    """Suppress sending to the chat until the user writes to the bot again"""
+    if telegram_id in _blocked:
+        return
+
+    BlockedChat.replace(telegram_id=telegram_id, blocked_at=datetime.now()).execute()
+    _blocked.add(telegram_id)
+    logging.info("Suppressed reminders to user %s", telegram_id)
+
+
+def unblock(telegram_id) -> None:
+    """Resume sending to the chat"""
+    if telegram_id not in _blocked:
+        return
+
+    BlockedChat.delete_by_id(telegram_id)
+    _blocked.discard(telegram_id)
+    logging.info("Resumed reminders to user %s", telegram_id)
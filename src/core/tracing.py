@@ -0,0 +1,80 @@
+import functools
+import logging
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+CORRELATION_HEADER = "X-Correlation-ID"
+
+correlation_id = ContextVar("correlation_id", default="-")
+_spans = ContextVar("spans", default=None)
+
+
+class CorrelationIdFilter(logging.Filter):
+    """Filter which adds the current correlation id to log records
+
+    Must run on the thread the record was logged from, before the record is queued.
+    """
+
+    def filter(self, record):
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+def new_id(prefix) -> str:
+    """Return a new correlation id, e.g. "reminder-1a2b3c4d" """
+    return f"{prefix}-{uuid.uuid4().hex[:8]}"
+
+
+@contextmanager
+def trace(id):
+    """Set the correlation id and collect the spans of the code inside
+
+    Yields:
+        list: (name, seconds) of the spans finished so far
+    """
+    spans = []
+    id_token = correlation_id.set(id)
+    spans_token = _spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _spans.reset(spans_token)
+        correlation_id.reset(id_token)
+
+
+@contextmanager
+def span(name):
+    """Time the code inside and add it to the spans of the current trace"""
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        duration = perf_counter() - start
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((name, duration))
+        logging.debug("Span %s took %.1f ms", name, duration * 1000)
+
+
+def format_spans(spans) -> str:
+    """Return spans as "GET /login 120.5 ms, GET /birthdays 80.1 ms" """
+    return ", ".join(f"{name} {duration * 1000:.1f} ms" for name, duration in spans)
+
+
+def traced(prefix):
+    """Run an async function with a new correlation id
+
+    Used for jobs, updates get their correlation id from the update processor.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with trace(new_id(prefix)):
+                return await function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
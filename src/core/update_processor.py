@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from time import perf_counter
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from src.core import metrics, tracing
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Update processor which handles updates of different users concurrently
+
+    Updates of the same user are processed one at a time in the order they were
+    received, so the conversation handlers see a user's updates as if they were
+    processed sequentially. Updates without a user are processed right away.
+
+    Up to `max_pending` updates are accepted at once, a user with many pending
+    updates doesn't take the processing slots of other users, because an update
+    waits for its user's turn before it takes one of the `max_concurrency` slots.
+
+    The time spent handling each update is recorded in `metrics.update_duration`.
+    Each update is handled with its own correlation id. Updates handled slower than
+    `slow_update` seconds are logged with the api calls they made.
+
+    Args:
+        max_concurrency (int): Maximum number of updates processed at once
+        max_pending (int): Maximum number of updates accepted at once, including
+          the ones waiting for their user's turn
+        commands (set): Commands whose duration is recorded under their name, other
+          commands are recorded as "command"
+        slow_update (float): Handling time in seconds after which an update is
+          logged as slow
+
+    Attributes:
+        user_locks (dict): `asyncio.Lock` of each user with pending updates
+    """
+
+    def __init__(self, max_concurrency, max_pending, commands=(), slow_update=1.0):
+        super().__init__(max_concurrent_updates=max(max_concurrency, max_pending))
+        self.commands = set(commands)
+        self.slow_update = slow_update
+        self.processing_slots = asyncio.Semaphore(max_concurrency)
+        self.user_locks = {}
+        self._pending = {}
+
+    async def do_process_update(self, update, coroutine) -> None:
+        user_id = _user_id(update)
+        if user_id is None:
+            async with self.processing_slots:
+                await self._timed(update, coroutine)
+            return
+
+        lock = self.user_locks.get(user_id)
+        if lock is None:
+            lock = self.user_locks[user_id] = asyncio.Lock()
+        self._pending[user_id] = self._pending.get(user_id, 0) + 1
+
+        try:
+            async with lock, self.processing_slots:
+                await self._timed(update, coroutine)
+        finally:
+            self._pending[user_id] -= 1
+            if not self._pending[user_id]:
+                del self._pending[user_id]
+                del self.user_locks[user_id]
+
+    async def _timed(self, update, coroutine) -> None:
+        update_id = update.update_id if isinstance(update, Update) else None
+        handler = self._handler_label(update)
+        start = perf_counter()
+
+        # the coroutine runs in this task, so it sees the correlation id
+        with tracing.trace(tracing.new_id(f"update-{update_id}")) as spans:
+            try:
+                await coroutine
+            finally:
+                duration = perf_counter() - start
+                metrics.update_duration.observe(duration, handler=handler)
+                if duration > self.slow_update:
+                    logging.warning(
+                        "Slow update %s (%s) took %.1f ms, api calls: %s",
+                        update_id,
+                        handler,
+                        duration * 1000,
+                        tracing.format_spans(spans) or "none",
+                    )
+
+    def _handler_label(self, update) -> str:
+        """Return the command of the update, or its kind if it isn't a command"""
+        if not isinstance(update, Update):
+            return "other"
+        if update.message and (update.message.text or "").startswith("/"):
+            # "/list@BirthdayBot args" -> "list"
+            command = update.message.text.split()[0][1:].split("@")[0]
+            return f"/{command}" if command in self.commands else "command"
+        if update.callback_query:
+            return "callback_query"
+        if update.message:
+            return "message"
+        return "other"
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+def _user_id(update):
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
@@ -12,43 +12,50 @@ from telegram.ext import (
 )
 from marshmallow import ValidationError
 
+from src.core import outbox
 from src.core.api_requests import put_request, get_request, get_by_id_request
+from src.core.log_format import summarize, truncate
 from src.core.schema import BirthdaysSchema
 from src.handlers.fallback import stop
+from src.handlers.snapshot import drop_snapshot, get_from_snapshot, save_snapshot
 
 
 CHANGE_GET_BIRTHDAY, CHANGE_NAME, CHANGE_DATE, CHANGE_NOTE = range(4)
 
+# fields of the chosen birthday the conversation edits
+BIRTHDAY_FIELDS = ("id", "name", "day", "month", "year", "note")
+
 birthdays_schema = BirthdaysSchema()
 
 
 async def change_birthday(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Request all birthdays, give user a keyboard to choose which birthday to change."""
-    logging.info(f"User {update.effective_user.id} is changing a birthday")
+    logging.info("User %s is changing a birthday", update.effective_user.id)
 
     context.user_data.clear()
 
     try:
-        response = get_request(update.effective_user.id)
+        response = await get_request(update.effective_user.id)
         if response.status_code != 404:
             response.raise_for_status()
             data = response.json()
         logging.info(
-            f"Retrieved {len(data)} birthdays for user {update.effective_user.id}"
+            "Retrieved %s birthdays for user %s", len(data), update.effective_user.id
         )
     except Exception as e:
         logging.error(
-            f"Failed to retrieve birthdays for user {update.effective_user.id}: {e}"
+            "Failed to retrieve birthdays for user %s: %s", update.effective_user.id, e
         )
         await update.message.reply_text("Failed. Please try again")
         return ConversationHandler.END
 
     if response.status_code == 404:
-        logging.warning(f"No birthdays found for user {update.effective_user.id}")
+        logging.warning("No birthdays found for user %s", update.effective_user.id)
         await update.message.reply_text("No birthdays found. /add_birthday to add one")
         return ConversationHandler.END
 
     data = sorted(data, key=lambda x: x["name"])
+    save_snapshot(context.user_data, data, fields=BIRTHDAY_FIELDS)
 
     keyboard = []
     for birthday in data:
@@ -64,29 +71,44 @@ async def change_birthday(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def change_get_birthday(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Request chosen birthday, ask for new name or to keep the same one."""
-    # HACK: Not optimal to request the birthday again, fix later
+    """Get chosen birthday, ask for new name or to keep the same one.
 
+    The birthday is taken from the snapshot saved by `change_birthday()`, it's
+    requested from the API only if the snapshot has expired.
+    """
     query = update.callback_query
     await query.answer()
 
     birthday_id = query.data
-    logging.info(f"User {update.effective_user.id} selected birthday ID: {birthday_id}")
+    logging.info(
+        "User %s selected birthday ID: %s", update.effective_user.id, birthday_id
+    )
 
-    try:
-        response = get_by_id_request(update.effective_user.id, birthday_id)
-        response.raise_for_status()
-        birthday_json = response.json()
-        logging.info(f"Retrieved birthday data for ID {birthday_id}: {birthday_json}")
-    except Exception as e:
-        logging.error(
-            f"Failed to retrieve birthday ID {birthday_id} for user {update.effective_user.id}: {e}"
-        )
-        await query.edit_message_text(
-            "Failed. Please try again. {traceback.format_exc()}"
-        )
-        return ConversationHandler.END
+    birthday_json = get_from_snapshot(context.user_data, birthday_id)
+    if birthday_json is None:
+        try:
+            response = await get_by_id_request(update.effective_user.id, birthday_id)
+            response.raise_for_status()
+            birthday_json = response.json()
+            logging.info(
+                "Retrieved birthday data for ID %s: %s",
+                birthday_id,
+                summarize(birthday_json),
+            )
+        except Exception as e:
+            logging.error(
+                "Failed to retrieve birthday ID %s for user %s: %s",
+                birthday_id,
+                update.effective_user.id,
+                e,
+            )
+            drop_snapshot(context.user_data)
+            await query.edit_message_text(
+                "Failed. Please try again. {traceback.format_exc()}"
+            )
+            return ConversationHandler.END
 
+    drop_snapshot(context.user_data)
     context.user_data["birthday_id"] = birthday_json["id"]
     context.user_data["name"] = birthday_json["name"]
     context.user_data["day"] = birthday_json["day"]
@@ -95,7 +117,9 @@ async def change_get_birthday(update: Update, context: ContextTypes.DEFAULT_TYPE
     context.user_data["note"] = birthday_json["note"]
 
     logging.info(
-        f"User {update.effective_user.id} will now edit birthday: {birthday_json['name']}"
+        "User %s will now edit birthday ID: %s",
+        update.effective_user.id,
+        birthday_json["id"],
     )
 
     await query.edit_message_text(
@@ -107,20 +131,20 @@ async def change_get_birthday(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def change_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Check new name, ask for new date or to keep the same one."""
     new_name = update.message.text
-    logging.info(f"User {update.effective_user.id} entered new name: {new_name}")
+    logging.info("User %s entered a new name", update.effective_user.id)
 
     if len(new_name) > 255:
         logging.warning(
-            f"User {update.effective_user.id} entered a name that is too long: {new_name}"
+            "User %s entered a name that is too long: %s chars",
+            update.effective_user.id,
+            len(new_name),
         )
         await update.message.reply_text(
             "That name is too long. Please choose a shorter one or send /skip to keep the same name:"
         )
         return CHANGE_NAME
     if new_name == context.user_data["name"]:
-        logging.warning(
-            f"User {update.effective_user.id} entered the same name: {new_name}"
-        )
+        logging.warning("User %s entered the same name", update.effective_user.id)
         await update.message.reply_text(
             "This name is the same. Input a new name or send /skip to keep the same name:"
         )
@@ -143,7 +167,7 @@ async def change_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def skip_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Not changing name, ask for new date or to keep the same one."""
-    logging.info(f"User {update.effective_user.id} chose to skip changing the name")
+    logging.info("User %s chose to skip changing the name", update.effective_user.id)
 
     if "new_day" in context.user_data or context.user_data.get("skipped_date"):
         return await put_birthday(update, context)
@@ -174,12 +198,14 @@ async def change_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data["new_month"] = date_json["month"]
         context.user_data["new_year"] = date_json["year"]
 
-        logging.info(
-            f"Validated new date for user {update.effective_user.id}: {date_json}"
-        )
+        logging.info("Validated new date for user %s", update.effective_user.id)
 
     except (ValueError, IndexError, ValidationError) as e:
-        logging.warning(f"Validation error for date: {new_date_text}. Error: {e}")
+        logging.warning(
+            "Validation error for date of user %s: %s",
+            update.effective_user.id,
+            type(e).__name__,
+        )
         await update.message.reply_text(
             "\n".join(e.messages)
             if isinstance(e, ValidationError)
@@ -201,7 +227,7 @@ async def change_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def skip_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Not changing date, ask for new note or to keep the same one."""
-    logging.info(f"User {update.effective_user.id} chose to skip changing the date")
+    logging.info("User %s chose to skip changing the date", update.effective_user.id)
 
     if "new_note" in context.user_data or context.user_data.get("skipped_note"):
         return await put_birthday(update, context)
@@ -220,11 +246,13 @@ async def skip_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def change_note(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Check new note, call `put_birthday()`."""
     new_note = update.message.text
-    logging.info(f"User {update.effective_user.id} entered new note: {new_note}")
+    logging.info("User %s entered a new note", update.effective_user.id)
 
     if len(new_note) > 255:
         logging.warning(
-            f"User {update.effective_user.id} entered a note that is too long: {new_note}"
+            "User %s entered a note that is too long: %s chars",
+            update.effective_user.id,
+            len(new_note),
         )
         await update.message.reply_text(
             "This note is too long. Please choose a shorter one. Send /skip to keep the same note, /delete_note to delete it:"
@@ -232,9 +260,7 @@ async def change_note(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return CHANGE_NOTE
 
     if new_note == context.user_data["note"]:
-        logging.warning(
-            f"User {update.effective_user.id} entered the same note: {new_note}"
-        )
+        logging.warning("User %s entered the same note", update.effective_user.id)
         await update.message.reply_text(
             "This note is the same. Input a new note, /delete_note to delete it, or send /skip to keep the same note:"
         )
@@ -246,7 +272,7 @@ async def change_note(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def skip_note(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Not changing note, call `put_birthday()`."""
-    logging.info(f"User {update.effective_user.id} chose to skip changing the note")
+    logging.info("User %s chose to skip changing the note", update.effective_user.id)
 
     context.user_data["skipped_note"] = True
     return await put_birthday(update, context)
@@ -254,7 +280,7 @@ async def skip_note(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def delete_note(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Set the note to None, call `put_birthday()`."""
-    logging.info(f"User {update.effective_user.id} chose to delete the note")
+    logging.info("User %s chose to delete the note", update.effective_user.id)
 
     context.user_data["new_note"] = None
     return await put_birthday(update, context)
@@ -275,22 +301,26 @@ async def put_birthday(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
 
     if nothing_changed(context.user_data):
-        logging.warning(f"User {update.effective_user.id} didn't change anything")
+        logging.warning("User %s didn't change anything", update.effective_user.id)
         await update.message.reply_text("No changes made. Don't waste my time.")
         return ConversationHandler.END
 
     data_json = _collect_data(context.user_data)
 
     try:
-        response = put_request(
+        response = await put_request(
             update.effective_user.id, context.user_data["birthday_id"], data_json
         )
-        logging.info(f"Put request response: {response.json()}")
+        logging.info(
+            "Put request response: %s %s",
+            response.status_code,
+            truncate(response.json()),
+        )
         if response.status_code != 422:
             response.raise_for_status()
     except Exception as e:
         logging.error(
-            f"Error putting birthday data for user {update.effective_user.id}: {str(e)}"
+            "Error putting birthday data for user %s: %s", update.effective_user.id, e
         )
         await update.message.reply_text("Failed. Please try again")
         context.user_data.clear()
@@ -322,12 +352,19 @@ async def put_birthday(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return CHANGE_DATE
         else:
             logging.warning(
-                f"Validation error from API for user {update.effective_user.id}: {response.json()}"
+                "Validation error from API for user %s: %s",
+                update.effective_user.id,
+                truncate(response.json()),
             )
             await update.message.reply_text("Invalid data. Please try again")
             return ConversationHandler.END
 
-    logging.info(f"User {update.effective_user.id} successfully changed birthday data")
+    logging.info("User %s successfully changed birthday data", update.effective_user.id)
+    try:
+        # reminders prefetched earlier in the day still have the old data
+        outbox.update_birthday(context.user_data["birthday_id"], data_json)
+    except Exception as e:
+        logging.error("Failed to update reminders of the changed birthday: %s", e)
     context.user_data.clear()
     await update.message.reply_text(
         "Birthday changed successfully! /list to see all birthdays"
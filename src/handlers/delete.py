@@ -8,9 +8,11 @@ from telegram.ext import (
     CallbackQueryHandler,
 )
 
+from src.core import outbox
 from src.core.api_requests import delete_request, get_request
 from src.core.schema import BirthdaysSchema
 from src.handlers.fallback import stop
+from src.handlers.snapshot import drop_snapshot, get_from_snapshot, save_snapshot
 
 
 DELETE_REQUEST = range(1)
@@ -21,33 +23,35 @@ birthdays_schema = BirthdaysSchema()
 
 async def delete_birthday(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Get all birthdays and ask which one to delete."""
-    logging.info(f"User {update.effective_user.id} is deleting a birthday")
+    logging.info("User %s is deleting a birthday", update.effective_user.id)
 
     context.user_data.clear()
 
     try:
-        response = get_request(update.effective_user.id)
+        response = await get_request(update.effective_user.id)
         if response.status_code != 404:
             response.raise_for_status()
             data = response.json()
         logging.info(
-            f"Retrieved {len(data)} birthdays for user {update.effective_user.id}"
+            "Retrieved %s birthdays for user %s", len(data), update.effective_user.id
         )
     except Exception as e:
         logging.error(
-            f"Failed to retrieve birthdays for user {update.effective_user.id}: {e}"
+            "Failed to retrieve birthdays for user %s: %s", update.effective_user.id, e
         )
         # TODO: notify admin
         await update.message.reply_text(f"Failed. Please try again")
         return ConversationHandler.END
 
     if response.status_code == 404:
-        logging.warning(f"No birthdays found for user {update.effective_user.id}")
+        logging.warning("No birthdays found for user %s", update.effective_user.id)
         await update.message.reply_text("No birthdays found. /add_birthday to add one")
         return ConversationHandler.END
 
     data = sorted(data, key=lambda x: x["name"])
-    logging.debug(f"Birthday data sorted by name for user {update.effective_user.id}")
+    logging.debug("Birthday data sorted by name for user %s", update.effective_user.id)
+    # only the name is shown once the birthday is deleted
+    save_snapshot(context.user_data, data, fields=("name",))
 
     keyboard = []
     for birthday in data:
@@ -63,27 +67,44 @@ async def delete_birthday(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def delete_handle_response(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Delete the chosen birthday or notify about failure."""
+    """Delete the chosen birthday or notify about failure.
+
+    The name of the birthday is taken from the snapshot saved by `delete_birthday()`.
+    """
     query = update.callback_query
     await query.answer()
 
     birthday_id = query.data
+    birthday = get_from_snapshot(context.user_data, birthday_id)
 
     try:
-        response = delete_request(update.effective_user.id, birthday_id)
+        response = await delete_request(update.effective_user.id, birthday_id)
         response.raise_for_status()
         logging.info(
-            f"Successfully deleted birthday with id {birthday_id} for user {update.effective_user.id}"
+            "Successfully deleted birthday with id %s for user %s",
+            birthday_id,
+            update.effective_user.id,
         )
     except Exception as e:
         logging.error(
-            f"Failed to delete birthday with id {birthday_id} for user {update.effective_user.id}: {e}"
+            "Failed to delete birthday with id %s for user %s: %s",
+            birthday_id,
+            update.effective_user.id,
+            e,
         )
+        drop_snapshot(context.user_data)
         await query.edit_message_text("Failed. Please try again}")
         return ConversationHandler.END
 
+    try:
+        outbox.discard(birthday_id)
+    except Exception as e:
+        logging.error("Failed to discard reminders of the deleted birthday: %s", e)
+    context.user_data.clear()
+
+    deleted = f"Birthday of {birthday['name']}" if birthday else "Birthday"
     await query.edit_message_text(
-        "Birthday deleted successfully. /list to see updated list"
+        f"{deleted} deleted successfully. /list to see updated list"
     )
     return ConversationHandler.END
 
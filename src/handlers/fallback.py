@@ -5,11 +5,14 @@ from telegram.ext import (
 )
 import logging
 
+from src.handlers.snapshot import drop_snapshot
+
 
 async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Stop current conversation
 
     Use as a fallback function in handlers
     """
-    logging.info(f"User {update.effective_user.id} stopped the conversation")
+    logging.info("User %s stopped the conversation", update.effective_user.id)
+    drop_snapshot(context.user_data)
     return ConversationHandler.END
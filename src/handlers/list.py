@@ -13,10 +13,10 @@ from src.core.api_requests import get_request
 async def list_birthdays(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a list of birthdays to the user"""
     context.user_data.clear()
-    logging.info(f"Sending a list of birthdays to user {update.effective_user.id}")
+    logging.info("Sending a list of birthdays to user %s", update.effective_user.id)
 
     try:
-        response = get_request(update.effective_user.id)
+        response = await get_request(update.effective_user.id)
         if response.status_code != 404:
             response.raise_for_status()
             data = response.json()
@@ -27,7 +27,7 @@ async def list_birthdays(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
     except Exception as e:
         logging.error(
-            f"Failed to retrieve birthdays for user {update.effective_user.id}: {e}"
+            "Failed to retrieve birthdays for user %s: %s", update.effective_user.id, e
         )
         await update.message.reply_text("Failed. Please try again")
         return
@@ -55,7 +55,7 @@ async def list_birthdays(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"{border} _Today:_ {date} --- *{birthday['name']}*{note}\n{border}"
             )
             inserted_today_panel = True
-        
+
         # Add the birthday to the list
         else:
             # Before appending any future or later birthdays, inject today-panel once
@@ -73,7 +73,7 @@ async def list_birthdays(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not inserted_today_panel:
         list_of_birthdays += f"{border}• {today_str} --- today\n{border}"
 
-    logging.info(f"Sent list of birthdays to user {update.effective_user.id}")
+    logging.info("Sent list of birthdays to user %s", update.effective_user.id)
     await update.message.reply_text(list_of_birthdays, parse_mode="Markdown")
 
 
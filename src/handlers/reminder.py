@@ -1,78 +1,456 @@
+import asyncio
 import datetime
+import json
 import logging
+from collections import OrderedDict
+from functools import partial
+from time import monotonic
 
+import pytz
+from telegram import ChatMember, Update
+from telegram.constants import MessageLimit
 from telegram.ext import ContextTypes
-from telegram.error import Forbidden
+from telegram.helpers import escape_markdown
 
-from src.core.api_requests import incoming_birthdays_request
+from src.core import job_runs, metrics, outbox, suppression, tracing
+from src.core.api_requests import incoming_birthdays_stream
+from src.core.config import config
+from src.core.dispatcher import MessageDispatcher
+from src.core.preferences import ReminderSchedule, ReminderShard
 
+REMINDER_JOB = "reminder"
+PREFETCH_JOB = "reminder_prefetch"
+CATCH_UP_JOB = "reminder_catch_up"
+CATCH_UP_OFFSETS = (0, 1)
+DIGESTS_MAX_PENDING = 1000
 
+_run_lock = asyncio.Lock()
+
+
+@tracing.traced(REMINDER_JOB)
 async def reminder(context: ContextTypes.DEFAULT_TYPE):
     """Send reminders about incoming birthdays
 
-    A callback function for the `job_queue`.
+    A callback function for the `job_queue`, should run every hour.
     Request the API for incoming birthdays and send a message to the user if
       they are today, tomorrow or in a week.
+    Only users whose reminder hour it is in their timezone get reminders, see
+      `ReminderShard`. The API isn't requested if there are no such users.
+    Reminders are usually prepared in advance by `prefetch_reminders()`, then the
+      run only sends the ones which are due. Until the prefetch of the day has
+      completed, each run requests the API for the users of its shard.
+    Reminders are enqueued to the outbox and marked as sent one by one, so a
+      run interrupted by a crash is resumed by the next run of the day without
+      sending anything twice. Sending starts while the response is still being
+      enqueued, see `_stream_digests()`. A run whose request failed, also halfway
+      through the response, isn't recorded, the next run of the day requests the
+      API again for its shard too, like `catch_up_reminders()` does. Entries
+      which were already enqueued are skipped.
+    Each user gets a digest of their reminders, see `render_digest()`.
+    Messages are sent concurrently by `MessageDispatcher` within Telegram's limits.
+    Users who blocked the bot are skipped until they write to it again, see
+      `resume_reminders()`.
     """
-    logging.info("Sending reminders about incoming birthdays")
+    start = monotonic()
+    run_time = _current_hour()
+    prefetched = _is_prefetched(run_time)
 
-    try:
-        response = incoming_birthdays_request()
-        if response.status_code == 404:
+    enqueued = await send_reminders(
+        context.bot,
+        run_time,
+        [] if prefetched else [ReminderShard(run_time)],
+        rate=config.getfloat("Reminder", "messages_per_second", fallback=30),
+    )
+
+    # earlier runs of the day which failed or were missed are caught up like
+    # `catch_up_reminders()` does, which might not have run yet after a restart
+    missed_runs = [
+        missed_run
+        for missed_run in _missed_runs(job_runs.get_last_run(REMINDER_JOB), run_time)
+        if missed_run.date() == run_time.date() and missed_run != run_time
+    ]
+    if missed_runs and not prefetched:
+        logging.info("Catching up %s missed reminder runs", len(missed_runs))
+        caught_up = await send_reminders(
+            context.bot,
+            run_time,
+            [ReminderShard(missed_run) for missed_run in missed_runs],
+            offsets=CATCH_UP_OFFSETS,
+            rate=config.getfloat(
+                "Reminder", "catch_up_messages_per_second", fallback=5
+            ),
+        )
+        enqueued = enqueued and caught_up
+
+    if enqueued:
+        job_runs.save_run(REMINDER_JOB, run_time)
+    metrics.reminder_run_duration.observe(monotonic() - start, job=REMINDER_JOB)
+
+
+@tracing.traced(PREFETCH_JOB)
+async def prefetch_reminders(context: ContextTypes.DEFAULT_TYPE):
+    """Prepare reminders of the day for all users in advance
+
+    A callback function for the `job_queue`, should run daily at an off-peak hour.
+    Request the API for incoming birthdays, render the reminders and enqueue them
+    to the outbox with the time each user gets them at, see `ReminderSchedule`.
+    The hourly runs then only send the due reminders.
+    """
+    start = monotonic()
+    run_time = _current_hour()
+    today = run_time.date()
+
+    async with _run_lock:
+        logging.info("Prefetching reminders about incoming birthdays")
+        try:
+            enqueued = await outbox.enqueue(
+                _in_shards(incoming_birthdays_stream()),
+                today,
+                render=render_reminder,
+                due_at=ReminderSchedule(today).due_at,
+            )
+        except Exception as e:
+            logging.error("Failed to prefetch incoming birthdays: %s", e)
+            # hourly runs keep requesting the API for their shards
             return
-        response.raise_for_status()
-    except Exception as e:
-        logging.error(f"Failed to retrieve incoming birthdays: {e}")
-        # TODO: notify admin
+
+    logging.info("Prefetched reminders about %s birthdays", enqueued)
+    job_runs.save_run(PREFETCH_JOB, run_time)
+    metrics.reminder_run_duration.observe(monotonic() - start, job=PREFETCH_JOB)
+
+
+@tracing.traced(CATCH_UP_JOB)
+async def catch_up_reminders(context: ContextTypes.DEFAULT_TYPE):
+    """Send reminders of the runs missed while the bot was down
+
+    A callback function for the `job_queue`, should run once after the start.
+    Only the runs of the last `catch_up_hours` hours are caught up, and only
+    reminders about birthdays today or tomorrow are sent, others aren't relevant
+    anymore. Messages are sent at a lower rate, to leave room for the users'
+    commands right after the start.
+    """
+    start = monotonic()
+    last_run = job_runs.get_last_run(REMINDER_JOB)
+    now = _current_hour()
+    if last_run is None:
+        job_runs.save_run(REMINDER_JOB, now)
         return
 
-    data = response.json()
+    missed_runs = _missed_runs(last_run, now)
+    if not missed_runs:
+        return
 
-    for birthday in data:
-        name = birthday["name"]
-        note = birthday["note"]
-        year = birthday["year"]
+    logging.info("Catching up %s missed reminder runs", len(missed_runs))
+    shards = (
+        []
+        if _is_prefetched(now)
+        else [ReminderShard(run_time) for run_time in missed_runs]
+    )
+    enqueued = await send_reminders(
+        context.bot,
+        now,
+        shards,
+        offsets=CATCH_UP_OFFSETS,
+        rate=config.getfloat("Reminder", "catch_up_messages_per_second", fallback=5),
+    )
+    if enqueued:
+        job_runs.save_run(REMINDER_JOB, now)
+    metrics.reminder_run_duration.observe(monotonic() - start, job=CATCH_UP_JOB)
 
-        if birthday["incoming_in_days"] == 0:
-            message = "*Today*"
-        elif birthday["incoming_in_days"] == 1:
-            message = "Tomorrow"
-        elif birthday["incoming_in_days"] == 7:
-            message = "Next week"
 
-        message += f" is *{name}*'s birthday"
+def _missed_runs(last_run, now) -> list:
+    """Return the hourly runs after `last_run` up to `now`, newest first
 
-        if year:
-            age = datetime.date.today().year - birthday["year"]
-            message += f" - turning {age}"
+    At most `catch_up_hours` runs are returned, none if `last_run` is `None`.
+    """
+    if last_run is None:
+        return []
+
+    catch_up_hours = config.getint("Reminder", "catch_up_hours", fallback=24)
+    return [
+        now - datetime.timedelta(hours=hours)
+        for hours in range(catch_up_hours)
+        if now - datetime.timedelta(hours=hours) > last_run
+    ]
 
-        if birthday["incoming_in_days"] == 0:
-            message += "!"
-        else:
-            message += "."
 
-        if note:
-            message += f"\n(your note: {note})"
+async def send_reminders(bot, run_time, shards, rate, offsets=None) -> bool:
+    """Enqueue reminders for the users in the shards, send all due reminders.
 
-        if birthday["incoming_in_days"] == 0:
-            message += "\nSend them best wishes! :)"
+    Runs don't overlap, a run waits for the previous one to finish.
 
+    Args:
+        bot (telegram.Bot): Bot to send reminders with
+        run_time (datetime): Aware UTC time of the run
+        shards (list): `ReminderShard` objects of the users to enqueue reminders
+          for, the API isn't requested if there are none
+        rate (float): Maximum number of messages per second
+        offsets (tuple): Numbers of days until the birthday to remind about, all
+          incoming birthdays if `None`
+
+    Returns:
+        bool: False if the reminders of the shards couldn't be enqueued, the run
+          should then be retried
+    """
+    today = run_time.date()
+    enqueued = 0
+    complete = True
+    batches = asyncio.Queue()
+
+    async with _run_lock:
+        if all(shard.is_empty() for shard in shards):
+            enqueuing = None
+            batches.put_nowait(None)
+        else:
+            logging.info("Enqueuing reminders about incoming birthdays")
+            enqueuing = asyncio.create_task(
+                _enqueue(
+                    _in_shards(incoming_birthdays_stream(), shards, offsets),
+                    today,
+                    batches,
+                )
+            )
+
+        dispatcher = MessageDispatcher(
+            bot,
+            max_concurrency=config.getint("Reminder", "max_concurrency", fallback=16),
+            rate=rate,
+            chat_rate=config.getfloat(
+                "Reminder", "chat_messages_per_second", fallback=1
+            ),
+            max_retries=config.getint("Reminder", "max_retries", fallback=3),
+            backoff=config.getfloat("Reminder", "retry_backoff", fallback=1),
+            is_suppressed=suppression.is_blocked,
+            on_blocked=suppression.block,
+        )
         try:
-            await context.bot.send_message(
-                chat_id=birthday["creator"]["telegram_id"],
-                text=message,
+            await dispatcher.run(
+                _stream_digests(today, run_time, offsets, batches),
                 parse_mode="Markdown",
             )
-            logging.info(
-                f"Sent message to user {birthday['creator']['telegram_id']}. Data: {birthday}"
-            )
-        except Forbidden as e:
-            logging.warning(
-                f"Failed to send message to user {birthday['creator']['telegram_id']}: {e}. "
-                "User might have blocked the bot or left the chat."
-            )
-        except Exception as e:
-            logging.error(
-                f"Failed to send message: {e}. User: {birthday['creator']['telegram_id']}, birthday id: {birthday['id']}"
-            )
-            # TODO: notify admin
+        finally:
+            if enqueuing:
+                # only still running if sending failed
+                enqueuing.cancel()
+
+        if enqueuing:
+            try:
+                enqueued = enqueuing.result()
+            except Exception as e:
+                logging.error("Failed to retrieve incoming birthdays: %s", e)
+                # TODO: notify admin
+                # reminders enqueued before the failure were still sent
+                complete = False
+        outbox.delete_old(today)
+
+    summary = dispatcher.summary
+    for result in ("sent", "failed", "blocked", "suppressed"):
+        metrics.reminder_messages.inc(getattr(summary, result), result=result)
+
+    # one line per run, messages to single users are logged at the debug level
+    logging.info(
+        "Reminder run at %s UTC: enqueued %s, %s",
+        f"{run_time:%Y-%m-%d %H:%M}",
+        enqueued,
+        summary,
+    )
+    return complete
+
+
+def _is_prefetched(run_time) -> bool:
+    """Check if reminders of the run's UTC date have been prefetched"""
+    last_prefetch = job_runs.get_last_run(PREFETCH_JOB)
+    return last_prefetch is not None and last_prefetch.date() == run_time.date()
+
+
+def _current_hour() -> datetime.datetime:
+    """Return the current aware UTC time truncated to the hour"""
+    return datetime.datetime.now(pytz.utc).replace(minute=0, second=0, microsecond=0)
+
+
+async def resume_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Resume reminders to a user who blocked the bot once they write to it again
+
+    Should handle every update before other handlers. A user blocking the bot is
+    suppressed right away instead.
+    """
+    if update.effective_user is None:
+        return
+
+    chat_member = update.my_chat_member
+    if chat_member and chat_member.new_chat_member.status == ChatMember.BANNED:
+        suppression.block(update.effective_user.id)
+    else:
+        suppression.unblock(update.effective_user.id)
+
+
+async def _in_shards(birthdays, shards=None, offsets=None):
+    """Yield birthdays of the users in any of the shards, all users if `None`"""
+    async for birthday in birthdays:
+        telegram_id = birthday["creator"]["telegram_id"]
+        if suppression.is_blocked(telegram_id):
+            continue
+        if offsets is not None and birthday["incoming_in_days"] not in offsets:
+            continue
+        if shards is None or any(telegram_id in shard for shard in shards):
+            yield birthday
+
+
+async def _enqueue(birthdays, date, batches) -> int:
+    """Enqueue the birthdays, put the users of each stored batch to `batches`
+
+    `None` is put to `batches` once the birthdays are enqueued or enqueuing failed.
+    """
+    try:
+        return await outbox.enqueue(
+            birthdays, date, render=render_reminder, on_insert=batches.put_nowait
+        )
+    finally:
+        batches.put_nowait(None)
+
+
+async def _stream_digests(
+    date, due_before, offsets, batches, max_pending=DIGESTS_MAX_PENDING
+):
+    """Yield digests of the users while their reminders are being enqueued.
+
+    Users of the stored batches are collected, at most `max_pending` at once. When
+    a new user doesn't fit, the digest of the user seen longest ago is sent, so
+    sending starts long before the whole response is enqueued. A user whose
+    birthdays are far apart in the response can get more than one digest. Once
+    enqueuing is done, all other pending reminders of the run are sent.
+
+    Args:
+        date (date): Date of the run
+        due_before (datetime): Aware datetime, only reminders due by then are sent
+        offsets (tuple): Numbers of days until the birthday to send reminders
+          about, all if `None`
+        batches (asyncio.Queue): Lists of users of the stored batches, `None`
+          once enqueuing is done
+        max_pending (int): Maximum number of users to collect
+
+    Yields:
+        tuple: messages as yielded by `render_digest()`
+    """
+    # entries being sent aren't marked as sent yet, they mustn't be read again
+    yielded = set()
+    seen = OrderedDict()
+
+    while (chat_ids := await batches.get()) is not None:
+        for chat_id in chat_ids:
+            seen[chat_id] = None
+            seen.move_to_end(chat_id)
+
+        ready = []
+        while len(seen) > max_pending:
+            ready.append(seen.popitem(last=False)[0])
+        if ready:
+            for message in _pending_digests(
+                date, due_before, offsets, yielded, chat_ids=ready
+            ):
+                yield message
+
+    for message in _pending_digests(date, due_before, offsets, yielded):
+        yield message
+
+
+def _pending_digests(date, due_before, offsets, yielded, chat_ids=None):
+    for chat_id, entries in outbox.pending(date, due_before, offsets, chat_ids):
+        entries = [entry for entry in entries if entry.id not in yielded]
+        if entries:
+            yielded.update(entry.id for entry in entries)
+            yield from render_digest(chat_id, entries)
+
+
+def render_digest(chat_id, entries):
+    """Render a digest of all reminders of the user.
+
+    Reminders in a digest are ordered by how soon the birthday is. A digest is
+    split into several messages only if it exceeds Telegram's message length limit.
+
+    Args:
+        chat_id (int): Telegram id of the user
+        entries (list): user's `OutboxEntry` objects
+
+    Yields:
+        tuple: (chat_id, text, on_sent, on_failed) of each message, the callbacks
+          mark the entries of the message as sent or as failed for good
+    """
+    entries = sorted(entries, key=lambda x: x.offset)
+    reminders = [
+        entry.text or render_reminder(json.loads(entry.birthday)) for entry in entries
+    ]
+
+    for message_reminders in split_message(reminders):
+        message_entries = entries[: len(message_reminders)]
+        entries = entries[len(message_reminders) :]
+
+        yield (
+            chat_id,
+            "\n\n".join(message_reminders),
+            partial(outbox.mark_sent, message_entries),
+            partial(outbox.mark_failed, message_entries),
+        )
+
+
+def split_message(parts, separator_length=2, limit=MessageLimit.MAX_TEXT_LENGTH):
+    """Split parts into as few messages as possible within the length limit.
+
+    Args:
+        parts (list): strings to join, each shorter than `limit`
+        separator_length (int): length of the separator the parts are joined with
+        limit (int): maximum length of a message
+
+    Returns:
+        list: lists of consecutive parts, one list for each message
+    """
+    messages = []
+    message = []
+    length = 0
+
+    for part in parts:
+        if message and length + separator_length + len(part) > limit:
+            messages.append(message)
+            message = []
+            length = 0
+
+        length += len(part) + (separator_length if message else 0)
+        message.append(part)
+
+    if message:
+        messages.append(message)
+    return messages
+
+
+def render_reminder(birthday) -> str:
+    """Return reminder message about the incoming birthday"""
+    # a single unescaped "_" or "*" would fail the user's whole digest
+    name = escape_markdown(birthday["name"], version=1)
+    note = birthday["note"] and escape_markdown(birthday["note"], version=1)
+    year = birthday["year"]
+
+    if birthday["incoming_in_days"] == 0:
+        message = "*Today*"
+    elif birthday["incoming_in_days"] == 1:
+        message = "Tomorrow"
+    elif birthday["incoming_in_days"] == 7:
+        message = "Next week"
+
+    message += f" is *{name}*'s birthday"
+
+    if year:
+        age = datetime.date.today().year - birthday["year"]
+        message += f" - turning {age}"
+
+    if birthday["incoming_in_days"] == 0:
+        message += "!"
+    else:
+        message += "."
+
+    if note:
+        message += f"\n(your note: {note})"
+
+    if birthday["incoming_in_days"] == 0:
+        message += "\nSend them best wishes! :)"
+
+    return message
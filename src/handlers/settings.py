@@ -0,0 +1,71 @@
+import logging
+
+import pytz
+from telegram import Update
+from telegram.ext import (
+    ContextTypes,
+)
+
+from src.core.preferences import get_preferences, save_preferences
+
+
+async def set_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Set the timezone reminders are sent in, show the current one without args."""
+    preferences = get_preferences(update.effective_user.id)
+
+    if not context.args:
+        await update.message.reply_text(
+            f"Your timezone is {preferences.timezone}. "
+            "Send /timezone Area/City to change it, e.g. /timezone Europe/Berlin"
+        )
+        return
+
+    timezone = context.args[0]
+    if timezone not in pytz.all_timezones_set:
+        logging.warning(
+            "User %s entered unknown timezone: %s", update.effective_user.id, timezone
+        )
+        await update.message.reply_text(
+            "Unknown timezone. Use the Area/City format, e.g. /timezone Europe/Berlin"
+        )
+        return
+
+    save_preferences(update.effective_user.id, timezone=timezone)
+    logging.info("User %s set timezone: %s", update.effective_user.id, timezone)
+    await update.message.reply_text(
+        f"Timezone set to {timezone}. "
+        f"Reminders will come at {preferences.reminder_hour}:00 your time."
+    )
+
+
+async def set_reminder_hour(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Set the hour reminders are sent at, show the current one without args."""
+    preferences = get_preferences(update.effective_user.id)
+
+    if not context.args:
+        await update.message.reply_text(
+            f"Reminders come at {preferences.reminder_hour}:00 "
+            f"({preferences.timezone}). Send /reminder_hour 0-23 to change it"
+        )
+        return
+
+    try:
+        reminder_hour = int(context.args[0])
+        if not 0 <= reminder_hour <= 23:
+            raise ValueError
+    except ValueError:
+        logging.warning(
+            "User %s entered invalid hour: %s",
+            update.effective_user.id,
+            context.args[0],
+        )
+        await update.message.reply_text("Invalid hour. Send a number from 0 to 23")
+        return
+
+    save_preferences(update.effective_user.id, reminder_hour=reminder_hour)
+    logging.info(
+        "User %s set reminder hour: %s", update.effective_user.id, reminder_hour
+    )
+    await update.message.reply_text(
+        f"Reminders will come at {reminder_hour}:00 ({preferences.timezone})."
+    )
@@ -0,0 +1,57 @@
+from time import time
+
+SNAPSHOT_EXPIRES_SECONDS = 5 * 60
+
+
+def save_snapshot(user_data, birthdays, fields) -> None:
+    """Store fetched birthdays in `user_data` for the rest of the conversation.
+
+    Birthdays are stored by their id as a string, the way it comes back in
+    callback queries. Only the fields the later steps of the conversation need
+    are kept, the snapshot stays in `user_data` until it's dropped.
+
+    Args:
+        user_data (dict): `user_data` of the conversation
+        birthdays (list): birthdays as returned by the api
+        fields (tuple): names of the fields to keep
+    """
+    user_data["snapshot"] = {
+        str(birthday["id"]): {field: birthday[field] for field in fields}
+        for birthday in birthdays
+    }
+    user_data["snapshot_time"] = time()
+
+
+def get_from_snapshot(user_data, birthday_id):
+    """Return birthday with the given id from the snapshot in `user_data`.
+
+    Return `None` if there is no snapshot, it has expired or doesn't contain the
+    birthday. The caller should request the birthday from the api then.
+    """
+    if is_expired(user_data):
+        return None
+
+    return user_data["snapshot"].get(str(birthday_id))
+
+
+def is_expired(user_data) -> bool:
+    """Check if the snapshot in `user_data` has expired or doesn't exist"""
+    return time() - user_data.get("snapshot_time", 0) > SNAPSHOT_EXPIRES_SECONDS
+
+
+def drop_snapshot(user_data) -> None:
+    """Remove the snapshot from `user_data` once it's not needed anymore"""
+    user_data.pop("snapshot", None)
+    user_data.pop("snapshot_time", None)
+
+
+def sweep_snapshots(user_data_by_user) -> None:
+    """Drop expired snapshots, e.g. of conversations the users abandoned
+
+    Args:
+        user_data_by_user (Mapping): `user_data` of each user, like
+          `Application.user_data`
+    """
+    for user_data in user_data_by_user.values():
+        if "snapshot" in user_data and is_expired(user_data):
+            drop_snapshot(user_data)
@@ -6,7 +6,7 @@ import logging
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logging.info(f"User {update.effective_user.id} started the bot")
+    logging.info("User %s started the bot", update.effective_user.id)
 
     await update.message.reply_text(
         "Welcome to BirthdayBot!\nYou can start by adding a birthday with /add command."
@@ -0,0 +1,7 @@
+"""Tests of the bot
+
+The bot reads its config on import, the tests use the temporary config of the
+benchmarks, see `benchmarks`.
+"""
+
+import benchmarks  # noqa: F401
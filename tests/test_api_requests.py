@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+
+from benchmarks.stub_api import BirthdayDataset, StubApi
+from src.core import api_requests
+from src.core.cache import ResponseCache
+
+
+class ApiRequestsTest(unittest.TestCase):
+    def setUp(self):
+        self.dataset = BirthdayDataset(size=30, users=10)
+        self.stub = StubApi(self.dataset, latency=0.01)
+        api_requests.api_client = api_requests.create_api_client(transport=self.stub)
+        api_requests.session_manager = api_requests.SessionManager()
+        # every cached response has expired and needs to be revalidated
+        api_requests.response_cache = ResponseCache(
+            ttl=-1, stale_ttl=60 * 60, max_entries=100, max_bytes=1024 * 1024
+        )
+
+    def test_expired_response_is_revalidated(self):
+        cache = api_requests.response_cache
+
+        first = asyncio.run(api_requests.get_request(1))
+        not_modified = asyncio.run(api_requests.get_request(1))
+
+        self.assertEqual(first.status_code, 200)
+        self.assertIs(not_modified, first)
+        self.assertEqual(cache.revalidations, 1)
+
+        self.dataset.change(1, {"name": "Changed"})
+        modified = asyncio.run(api_requests.get_request(1))
+
+        self.assertIsNot(modified, first)
+        self.assertEqual(modified.status_code, 200)
+        self.assertIn("Changed", [birthday["name"] for birthday in modified.json()])
+        self.assertIs(cache.get_stale(1, str(modified.request.url)), modified)
+        self.assertEqual(cache.revalidations, 1)
+        self.assertEqual(self.stub.requests["GET /birthdays"], 3)
+
+    def test_concurrent_callers_share_one_login(self):
+        async def get_sessions():
+            return await asyncio.gather(
+                *(api_requests.session_manager.get_session(7) for _ in range(20))
+            )
+
+        sessions = asyncio.run(get_sessions())
+
+        self.assertEqual(len({id(session) for session in sessions}), 1)
+        self.assertEqual(self.stub.requests["GET /login"], 1)
+        self.assertEqual(api_requests.session_manager.misses, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import asyncio
+import unittest
+
+from benchmarks.fake_bot import FakeBot
+from src.core.dispatcher import MessageDispatcher
+
+
+def dispatcher(bot, **kwargs) -> MessageDispatcher:
+    return MessageDispatcher(
+        bot, max_concurrency=2, rate=1000, chat_rate=1000, **kwargs
+    )
+
+
+def locked():
+    raise RuntimeError("database is locked")
+
+
+class MessageDispatcherTest(unittest.TestCase):
+    def test_failing_callback_doesnt_stop_the_run(self):
+        bot = FakeBot()
+        messages = [(chat_id, "Hi", locked) for chat_id in range(1, 21)]
+
+        with self.assertLogs(level="ERROR"):
+            summary = asyncio.run(
+                asyncio.wait_for(dispatcher(bot).run(messages), timeout=5)
+            )
+
+        self.assertEqual(summary.sent, 20)
+        self.assertEqual(len(bot.sent), 20)
+
+    def test_dead_worker_aborts_the_run(self):
+        def is_suppressed(chat_id):
+            raise RuntimeError("database is locked")
+
+        messages = [(chat_id, "Hi") for chat_id in range(1, 21)]
+        run = dispatcher(FakeBot(), is_suppressed=is_suppressed).run(messages)
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(asyncio.wait_for(run, timeout=5))
+
+
+if __name__ == "__main__":
+    unittest.main()
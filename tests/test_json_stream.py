@@ -0,0 +1,103 @@
+import asyncio
+import json
+import random
+import unittest
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.stub_api import BirthdayDataset, StubApi
+from src.core.json_stream import JSONArrayParser
+
+ITEMS = [
+    {"id": 1, "name": "Ann", "note": None},
+    {"id": 2, "name": 'quoted "]}, name', "note": "ünïcode ✓"},
+    {"id": 3, "nested": {"list": [1, [2, {"x": "]"}]], "empty": {}}},
+    [],
+    [{"a": "\\"}, "b"],
+]
+
+
+def parse(chunks, **kwargs) -> list:
+    parser = JSONArrayParser(**kwargs)
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    parser.close()
+    return items
+
+
+class JSONArrayParserTest(unittest.TestCase):
+    def test_every_split_point(self):
+        body = json.dumps(ITEMS, indent=1)
+        for split in range(len(body) + 1):
+            with self.subTest(split=split):
+                self.assertEqual(parse([body[:split], body[split:]]), ITEMS)
+
+    def test_random_chunks(self):
+        body = json.dumps(ITEMS * 50)
+        rng = random.Random(0)
+        for _ in range(100):
+            chunks = []
+            position = 0
+            while position < len(body):
+                size = rng.randint(1, 40)
+                chunks.append(body[position : position + size])
+                position += size
+            self.assertEqual(parse(chunks), ITEMS * 50)
+
+    def test_single_characters(self):
+        body = json.dumps(ITEMS)
+        self.assertEqual(parse(body), ITEMS)
+
+    def test_empty_array(self):
+        self.assertEqual(parse([" [ ", " ] "]), [])
+
+    def test_incomplete_array(self):
+        parser = JSONArrayParser()
+        parser.feed('[{"id": 1}, {"id"')
+        with self.assertRaises(ValueError):
+            parser.close()
+
+    def test_not_an_array(self):
+        with self.assertRaises(ValueError):
+            JSONArrayParser().feed('{"id": 1}')
+
+    def test_malformed_item_is_not_buffered_forever(self):
+        parser = JSONArrayParser(max_item_size=100)
+        parser.feed('[{"id": 1}, {"id": oops')
+        with self.assertRaises(ValueError):
+            for _ in range(10):
+                parser.feed(" " * 20)
+        self.assertLessEqual(len(parser.buffer), 200)
+
+
+class StubApiStreamTest(unittest.TestCase):
+    def test_incoming_birthdays_are_streamed_in_chunks(self):
+        dataset = BirthdayDataset(size=3000, users=10)
+
+        async def read():
+            async with httpx.AsyncClient(
+                transport=StubApi(dataset, chunk_size=64), base_url="http://stub"
+            ) as client:
+                async with client.stream(
+                    "GET",
+                    "/admin/birthdays/incoming",
+                    cookies={"access_token_cookie": "admin"},
+                ) as response:
+                    parser = JSONArrayParser()
+                    chunks, items = 0, []
+                    async for chunk in response.aiter_text():
+                        chunks += 1
+                        items.extend(parser.feed(chunk))
+                    parser.close()
+                    return chunks, items
+
+        chunks, items = asyncio.run(read())
+        expected = list(dataset.incoming(datetime.now(timezone.utc).date()))
+        self.assertEqual([item["id"] for item in items], [b["id"] for b in expected])
+        self.assertGreater(chunks, len(items))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import asyncio
+import datetime
+import unittest
+
+import pytz
+from telegram.error import BadRequest
+
+from benchmarks.fake_bot import FakeBot
+from benchmarks.stub_api import BirthdayDataset, StubApi
+from src.core import api_requests, outbox
+from src.core.outbox import OutboxEntry
+from src.core.preferences import ReminderSchedule, ReminderShard
+from src.handlers import reminder
+
+
+class CrashingBot(FakeBot):
+    """Bot which hangs after sending `limit` messages, like a process which died"""
+
+    def __init__(self, limit):
+        super().__init__()
+        with self._unfrozen():
+            self.limit = limit
+
+    async def _do_post(self, endpoint, data, **timeouts):
+        if endpoint == "sendMessage" and len(self.sent) >= self.limit:
+            await asyncio.Event().wait()
+        return await super()._do_post(endpoint, data, **timeouts)
+
+
+class ChatNotFoundBot(FakeBot):
+    """Bot which can't send messages to chat 3"""
+
+    async def _do_post(self, endpoint, data, **timeouts):
+        if endpoint == "sendMessage" and int(data["chat_id"]) == 3:
+            self.sent.append((3, data["text"]))
+            raise BadRequest("Chat not found")
+        return await super()._do_post(endpoint, data, **timeouts)
+
+
+class OutboxTest(unittest.TestCase):
+    def setUp(self):
+        OutboxEntry.delete().execute()
+        self.dataset = BirthdayDataset(size=60, users=10)
+        api_requests.api_client = api_requests.create_api_client(
+            transport=StubApi(self.dataset)
+        )
+        today = datetime.datetime.now(pytz.utc).date()
+        self.run_time = ReminderSchedule(today).default_time
+        self.date = self.run_time.date()
+
+    def send_reminders(self, bot):
+        return reminder.send_reminders(
+            bot, self.run_time, [ReminderShard(self.run_time)], rate=1000
+        )
+
+    def enqueue(self):
+        return asyncio.run(
+            outbox.enqueue(
+                api_requests.incoming_birthdays_stream(),
+                self.date,
+                render=reminder.render_reminder,
+            )
+        )
+
+    def test_enqueuing_twice_is_ignored(self):
+        consumed = self.enqueue()
+        entries = OutboxEntry.select().count()
+
+        self.assertEqual(self.enqueue(), consumed)
+        self.assertEqual(OutboxEntry.select().count(), entries)
+        self.assertEqual(entries, consumed)
+
+    def test_run_after_crash_sends_only_the_rest(self):
+        crashed = CrashingBot(limit=4)
+
+        async def crash():
+            run = asyncio.create_task(self.send_reminders(crashed))
+            while len(crashed.sent) < 4:
+                await asyncio.sleep(0.01)
+            run.cancel()
+
+        asyncio.run(crash())
+        sent = OutboxEntry.select().where(OutboxEntry.sent_at.is_null(False))
+        self.assertEqual(
+            {entry.chat_id for entry in sent},
+            {chat_id for chat_id, _ in crashed.sent},
+        )
+
+        resumed = FakeBot()
+        self.assertTrue(asyncio.run(self.send_reminders(resumed)))
+
+        crashed_chats = {chat_id for chat_id, _ in crashed.sent}
+        resumed_chats = {chat_id for chat_id, _ in resumed.sent}
+        self.assertEqual(len(crashed_chats), 4)
+        self.assertFalse(crashed_chats & resumed_chats)
+        self.assertEqual(
+            crashed_chats | resumed_chats, set(range(1, self.dataset.users + 1))
+        )
+        self.assertFalse(list(outbox.pending(self.date)))
+
+    def test_failed_entries_are_skipped(self):
+        bot = ChatNotFoundBot()
+        with self.assertLogs(level="ERROR"):
+            for _ in range(3):
+                asyncio.run(self.send_reminders(bot))
+
+        self.assertEqual(len([chat_id for chat_id, _ in bot.sent if chat_id == 3]), 1)
+        failed = OutboxEntry.select().where(OutboxEntry.failed_at.is_null(False))
+        self.assertTrue(failed.count())
+        self.assertEqual({entry.chat_id for entry in failed}, {3})
+        self.assertFalse(list(outbox.pending(self.date)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import asyncio
+import random
+import unittest
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from benchmarks import updates
+from benchmarks.fake_bot import FakeBot
+from src.birthday_bot import build_application
+
+USERS = 5
+UPDATES_PER_USER = 10
+
+
+class PerUserUpdateProcessorTest(unittest.TestCase):
+    def test_updates_of_a_user_are_handled_in_order_and_users_overlap(self):
+        events = []
+
+        async def record(update, context):
+            user_id = update.effective_user.id
+            events.append(("start", user_id, update.update_id))
+            # give updates of the same user a chance to overtake this one
+            await asyncio.sleep(random.uniform(0, 0.01))
+            events.append(("end", user_id, update.update_id))
+
+        async def replay():
+            bot = FakeBot()
+            application = build_application(bot)
+            application.add_handler(TypeHandler(Update, record), group=-1000)
+            queued = [
+                updates.message(bot, user_id, f"message {number}")
+                for number in range(UPDATES_PER_USER)
+                for user_id in range(1, USERS + 1)
+            ]
+
+            await application.initialize()
+            await application.start()
+            for update in queued:
+                await application.update_queue.put(update)
+            await asyncio.wait_for(application.update_queue.join(), timeout=10)
+            # the last updates may still be handled after they left the queue
+            while len(events) < 2 * len(queued):
+                await asyncio.sleep(0.01)
+            await application.stop()
+            await application.shutdown()
+            return queued
+
+        queued = asyncio.run(replay())
+
+        for user_id in range(1, USERS + 1):
+            with self.subTest(user_id=user_id):
+                user_events = [event for event in events if event[1] == user_id]
+                expected = [
+                    update.update_id
+                    for update in queued
+                    if update.effective_user.id == user_id
+                ]
+                # one update at a time: every start is followed by its end
+                self.assertEqual(
+                    user_events,
+                    [
+                        (kind, user_id, update_id)
+                        for update_id in expected
+                        for kind in ("start", "end")
+                    ],
+                )
+
+        handling = 0
+        most_handling = 0
+        for kind, _, _ in events:
+            handling += 1 if kind == "start" else -1
+            most_handling = max(most_handling, handling)
+        self.assertGreater(most_handling, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()